@@ -0,0 +1,125 @@
+"""
+台灣地址解析
+將地址拆成 縣市/行政區/村里/路街/段/巷/弄/號/樓層，並產生標準化鍵：
+Geocoding 快取鍵不含樓層與村里，讓「之」與「-」、全形數字、樓層後綴、有無村里等寫法差異
+對應到同一筆快取，避免重複呼叫付費的 Geocoding API
+"""
+
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+
+from pipeline_config import CITIES, ZIP_CODES
+
+ParsedAddress = namedtuple(
+    "ParsedAddress", ["city", "district", "village", "road", "section", "lane", "alley", "number", "floor"])
+
+_KNOWN_CITIES = tuple(sorted(set(CITIES.values()), key=len, reverse=True))
+_KNOWN_DISTRICTS = tuple(sorted(set(ZIP_CODES.values()), key=len, reverse=True))
+_CHINESE_NUMERALS = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5",
+                     "六": "6", "七": "7", "八": "8", "九": "9", "十": "10"}
+
+_RE_WHITESPACE = re.compile(r"\s+")
+# 只替換號碼之間的「之」「至」(12之3號、12號之3)，路名中的字 (至善路) 保留
+_RE_NUMBER_JOINER = re.compile(r"(?<=[\d號])[之至](?=\d)")
+# 號後的「之N」緊接空白 (12號之3 5樓)：去除空白前先改寫成 12-3號，否則之3會與樓層連在一起
+SUB_NUMBER_PATTERN = re.compile(r"(\d+)號[之\-](\d+)(?=\s)")
+SUB_NUMBER_REPLACEMENT = r"\1-\2號"
+_RE_CHINESE_SECTION = re.compile(r"([一二三四五六七八九十])段")
+_RE_CITY = re.compile(r"^(.{2}[縣市])")
+_RE_DISTRICT = re.compile(r"^(.{2,3}?[鄉鎮市區])")
+# 村里後面不能緊接著路/街/大道 (例如「萬里街」不是村里)
+_RE_VILLAGE = re.compile(r"^(.{2,3}?[村里])(?!路|街|大道)")
+_RE_NEIGHBORHOOD = re.compile(r"^\d+鄰")
+_RE_BODY = re.compile(
+    r"^(?P<road>.*?(?:路|街|大道))?"
+    r"(?:(?P<section>\d+)段)?"
+    r"(?:(?P<lane>\d+(?:-\d+)?)巷)?"
+    r"(?:(?P<alley>\d+(?:-\d+)?)弄)?"
+    r"(?:(?P<number>\d+(?:-\d+)?)號(?:-(?P<sub>\d+)(?![\d樓Ff]))?)?"
+    r"(?P<floor>.*)$", re.S)
+_RE_FLOOR_F = re.compile(r"^(\d+)[Ff]$")
+
+
+def normalize_address(address):
+    """NFKC (full-width digits), 12號之3 -> 12-3號 before a space, drop whitespace, 臺->台, numeric 之/至 -> "-", Chinese section numerals -> digits."""
+    if address is None or address != address:  # None / NaN
+        return ""
+    text = SUB_NUMBER_PATTERN.sub(SUB_NUMBER_REPLACEMENT, unicodedata.normalize("NFKC", str(address)))
+    text = _RE_NUMBER_JOINER.sub("-", _RE_WHITESPACE.sub("", text).replace("臺", "台"))
+    return _RE_CHINESE_SECTION.sub(lambda m: _CHINESE_NUMERALS[m.group(1)] + "段", text)
+
+
+def _take_prefix(text, hint, known, pattern):
+    """Split off a leading city/district: the given hint, else a known name, else the generic pattern.
+
+    With a hint, only that exact name is stripped; the generic pattern is
+    not tried, since a cleaned address without the prefix would otherwise
+    be mis-split (e.g. 「民生市場」).
+    """
+    if hint:
+        return (hint, text[len(hint):]) if text.startswith(hint) else (hint, text)
+    for name in known:
+        if text.startswith(name):
+            return name, text[len(name):]
+    m = pattern.match(text)
+    if m:
+        return m.group(1), text[m.end():]
+    return "", text
+
+
+@lru_cache(maxsize=200_000)
+def parse_address(address, city="", district=""):
+    """Parse an address into a ParsedAddress (memoized).
+
+    `city` / `district` are the known 縣市 / 行政區 of the row; they are
+    used when the address itself omits them (the cleaner strips them).
+    Unparsed trailing text (floor, room, landmark) ends up in `floor`.
+    """
+    text = normalize_address(address)
+    city = normalize_address(city)
+    district = normalize_address(district)
+
+    city, text = _take_prefix(text, city, _KNOWN_CITIES, _RE_CITY)
+    district, text = _take_prefix(text, district, _KNOWN_DISTRICTS, _RE_DISTRICT)
+
+    village = ""
+    m = _RE_VILLAGE.match(text)
+    if m:
+        village, text = m.group(1), text[m.end():]
+    text = _RE_NEIGHBORHOOD.sub("", text)
+
+    body = _RE_BODY.match(text)
+    number = body.group("number") or ""
+    if number and body.group("sub"):
+        number = f"{number}-{body.group('sub')}"
+    floor = _RE_FLOOR_F.sub(r"\1樓", body.group("floor"))
+
+    return ParsedAddress(city, district, village, body.group("road") or "", body.group("section") or "",
+                         body.group("lane") or "", body.group("alley") or "", number, floor)
+
+
+def format_address(parsed, with_floor=False):
+    """Render a ParsedAddress back to a canonical string.
+
+    Without a house number the address is not specific enough to drop
+    anything, so the village and the unparsed remainder are kept.
+    """
+    parts = [parsed.city, parsed.district]
+    if not parsed.number:
+        parts.append(parsed.village)
+    parts.append(parsed.road)
+    if parsed.section: parts.append(f"{parsed.section}段")
+    if parsed.lane: parts.append(f"{parsed.lane}巷")
+    if parsed.alley: parts.append(f"{parsed.alley}弄")
+    if parsed.number: parts.append(f"{parsed.number}號")
+    if with_floor or not parsed.number:
+        parts.append(parsed.floor)
+    return "".join(parts)
+
+
+@lru_cache(maxsize=200_000)
+def canonical_address(address, city="", district="", with_floor=False):
+    """Canonical form of an address; the default (no floor) is the geocoding cache key."""
+    return format_address(parse_address(address, city, district), with_floor=with_floor)
@@ -0,0 +1,115 @@
+"""
+run_cleaner 一致性檢查與效能比較
+以大型合成資料 (含 NaN、全形字、分機、臺/之/一段 等變化) 比對舊版逐列 apply 實作
+與目前向量化的 run_cleaner，輸出必須完全相同
+
+使用方式:
+    python benchmarks/bench_cleaner.py               # 預設 200,000 列
+    python benchmarks/bench_cleaner.py --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_parser import SUB_NUMBER_PATTERN, SUB_NUMBER_REPLACEMENT, canonical_address  # noqa: E402
+from data_pipeline_gemini import run_cleaner  # noqa: E402
+from nccc_pages import synthetic_merchants  # noqa: E402
+
+
+def legacy_run_cleaner(df):
+    """The row-wise implementation run_cleaner replaced (with the current address dedup key)."""
+    if df.empty: return df
+
+    def clean_text(text, address=False):
+        if pd.isna(text): return ""
+        text = unicodedata.normalize('NFKC', str(text))
+        if address:
+            text = SUB_NUMBER_PATTERN.sub(SUB_NUMBER_REPLACEMENT, text)
+        text = text.replace(" ", "").replace("　", "").replace("臺", "台")
+        replacements = {'一段': '1段', '二段': '2段', '三段': '3段', '至': '-', '之': '-'}
+        for k, v in replacements.items(): text = text.replace(k, v)
+        text = re.sub(r'^.{2,3}[縣市]', '', text)
+        text = re.sub(r'^.{2,4}[鄉鎮市區]', '', text)
+        text = re.sub(r'^.{2,4}[村里]', '', text)
+        return text
+
+    def clean_phone(text):
+        if pd.isna(text): return ""
+        text = unicodedata.normalize('NFKC', str(text))
+        text = text.replace(" ", "").replace("　", "")
+        if '#' in text:
+            parts = text.split('#', 1)
+            main = re.sub(r'\D', '', parts[0])
+            ext = parts[1]
+            return f"{main}#{ext}"
+        else:
+            return re.sub(r'\D', '', text)
+
+    df['特店名稱'] = df['特店名稱'].apply(clean_text)
+    df['地址'] = df['地址'].apply(clean_text, address=True)
+
+    df['電話'] = df['電話'].apply(clean_phone)
+
+    df['dedup_key'] = df.apply(lambda row: re.sub(r'\D', '', row['電話']) + '_' + canonical_address(
+        row['地址'], row['縣市'], row['行政區'], with_floor=True), axis=1)
+    df.drop_duplicates(subset=['dedup_key'], keep='first', inplace=True)
+    return df.drop(columns=['dedup_key'])
+
+
+# 刻意加入的邊界案例
+EDGE_NAMES = [None, float("nan"), "", "  ", "臺北 老爺　酒店", "ＡＢＣ１２３商行", "台北市中山區某某店", "一段之家", "\n換行\n店"]
+EDGE_PHONES = [None, float("nan"), "", "(02)2345-6789", "０２－２３４５６７８９", "02-2345-6789#123", "02 2345 6789 # 分機 12",
+               "#99", "02#3#4", "0912345678", 22345678, "٠٢-٢٣٤٥", "02\n2345#分機\n9", "（０２）２７１２－３４５６＃８８"]
+EDGE_ADDRS = [None, float("nan"), "", "臺北市士林區中山北路一段之3號", "台北市士林區士林區中正路12號", "新北市板橋區文化里中山路二段12號至14號",
+              "１２３號　３樓", "大安區忠孝東路三段", "北投區", "高雄市", "嘉義縣民雄鄉東榮村建國路3段", "台中市 西屯區 台灣大道 四段 1號",
+              "台北市\n士林區中正路1號", "南投縣\n埔里鎮中山路一段",
+              "士林區中正路12號之3 5樓", "中正路１２號之３　５樓", "中正路12號 5樓"]
+
+
+def synthetic_frame(n, seed=0):
+    rng = random.Random(seed)
+    rows = synthetic_merchants(n, seed=seed)
+    names, inds, phones, addrs = (list(col) for col in zip(*rows))
+    for i in range(0, n, 7):
+        names[i] = rng.choice(EDGE_NAMES)
+        phones[i] = rng.choice(EDGE_PHONES)
+        addrs[i] = rng.choice(EDGE_ADDRS)
+    # 重複的特店 (需被去重)
+    for i in range(3, n, 11):
+        j = rng.randrange(n)
+        phones[i], addrs[i] = phones[j], addrs[j]
+    return pd.DataFrame({"縣市": "台北市", "行政區": "士林區", "特店名稱": names, "行業別": inds, "電話": phones, "地址": addrs})
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and timing for run_cleaner")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows)
+    expected, legacy_seconds = timed(legacy_run_cleaner, df)
+    actual, new_seconds = timed(run_cleaner, df)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    print(f"Parity OK: {len(df)} rows in, {len(actual)} rows out")
+    print(f"legacy apply:  {legacy_seconds:7.3f}s")
+    print(f"vectorized:    {new_seconds:7.3f}s  ({legacy_seconds / new_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Gemini 輸出格式比較 (CSV vs. schema 限定的 JSON)
+以本地替身 client (gemini_stub) 執行 run_gemini_processor，替身會在評論中混入 `|`、引號、開頭語與代碼區塊；
+回報每種模式的請求數、無法解析的回應比例 (重試率)、遺失列數、解析時間與累計的重試等待秒數。
+json-fallback 模擬不支援 response schema 的模型，應自動改用 CSV
+
+使用方式:
+    python benchmarks/bench_gemini_output.py
+    python benchmarks/bench_gemini_output.py --rows 3000 --pipe-rate 0.05 --modes csv,json
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_pipeline_gemini as pipeline  # noqa: E402
+from gemini_stub import GeminiStubClient  # noqa: E402
+from nccc_pages import synthetic_merchants  # noqa: E402
+
+
+class ParseRecorder:
+    """Counts and times every _parse_gemini_response call and the retry sleeps of the pipeline."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.sleep_seconds = 0.0
+
+    def __enter__(self):
+        self._parse = pipeline._parse_gemini_response
+        self._sleep = asyncio.sleep
+        recorder = self
+
+        def timed_parse(*args, **kwargs):
+            start = time.perf_counter()
+            recorder.calls += 1
+            try:
+                result = recorder._parse(*args, **kwargs)
+            except Exception:
+                recorder.failures += 1
+                raise
+            finally:
+                recorder.seconds += time.perf_counter() - start
+            if result.empty:
+                recorder.failures += 1
+            return result
+
+        async def no_wait(delay, result=None):
+            # 重試等待只累計不實際等待
+            recorder.sleep_seconds += delay
+            return await recorder._sleep(0, result)
+
+        pipeline._parse_gemini_response = timed_parse
+        asyncio.sleep = no_wait
+        return self
+
+    def __exit__(self, *exc):
+        pipeline._parse_gemini_response = self._parse
+        asyncio.sleep = self._sleep
+
+
+def synthetic_frame(n):
+    rows = synthetic_merchants(n, seed=3)
+    return pd.DataFrame({"縣市": "台北市", "行政區": "士林區", "特店名稱": [r[0] for r in rows], "行業別": [r[1] for r in rows],
+                         "電話": [r[2] for r in rows], "地址": [r[3] for r in rows],
+                         "lat": 25.09, "lng": 121.52, "hidden_tags": ""})
+
+
+def run_mode(mode, df, args):
+    stub = GeminiStubClient(seed=args.seed, latency=args.latency, pipe_rate=args.pipe_rate, quote_rate=args.quote_rate,
+                            schema_supported=mode != "json-fallback")
+    pipeline.set_gemini_client(stub)
+    pipeline.GEMINI_OUTPUT_MODE = "csv" if mode == "csv" else "json"
+    pipeline._schema_unsupported_models.clear()
+    pipeline._chunk_sizer = None
+
+    with ParseRecorder() as recorder:
+        start = time.perf_counter()
+        results = pipeline.run_gemini_processor(df, "001", "111", "0008", use_cache=False)
+        seconds = time.perf_counter() - start
+
+    stats = stub.stats
+    returned = {str(r.get("id")) for r in results}
+    return {
+        "mode": mode,
+        "requests": stats.requests,
+        "json_requests": stats.json_requests,
+        "rejected": stats.rejected,
+        "failed_responses": recorder.failures,
+        "retry_rate": recorder.failures / max(1, recorder.calls),
+        "rows_sent": stats.rows_requested,
+        "rows_lost": len(df) - len(returned),
+        "parse_ms": recorder.seconds * 1000,
+        "retry_wait_s": recorder.sleep_seconds,
+        "seconds": seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Gemini CSV and JSON output modes against a local stub client")
+    parser.add_argument("--rows", type=int, default=1500)
+    parser.add_argument("--modes", default="csv,json,json-fallback")
+    parser.add_argument("--pipe-rate", type=float, default=0.03, help="share of reviews containing '|'")
+    parser.add_argument("--quote-rate", type=float, default=0.02, help="share of reviews starting with a quote")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pipeline.BUCKET_NAME = None
+    df = synthetic_frame(args.rows)
+    results = []
+    for mode in args.modes.split(","):
+        results.append(run_mode(mode, df, args))
+
+    print(f"\n{args.rows} rows, pipe rate {args.pipe_rate:.0%}, quote rate {args.quote_rate:.0%}")
+    print(f"{'mode':<14}{'requests':>9}{'failed':>8}{'retry%':>8}{'rows sent':>10}{'lost':>6}{'parse ms':>10}{'wait s':>8}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['requests']:>9}{r['failed_responses']:>8}{r['retry_rate']:>8.1%}{r['rows_sent']:>10}"
+              f"{r['rows_lost']:>6}{r['parse_ms']:>10.1f}{r['retry_wait_s']:>8.0f}")
+    if any(r["mode"] == "json-fallback" for r in results):
+        fallback = next(r for r in results if r["mode"] == "json-fallback")
+        # 被拒絕後不應再送出 JSON 請求
+        assert fallback["rejected"] >= 1 and fallback["json_requests"] == fallback["rejected"]
+        print(f"json-fallback: {fallback['rejected']} request(s) rejected before switching to CSV")
+
+
+if __name__ == "__main__":
+    main()
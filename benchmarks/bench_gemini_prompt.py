@@ -0,0 +1,69 @@
+"""
+Gemini 靜態指令的送出方式比較 (inline / system instruction / context cache)
+以本地替身 client (gemini_stub) 執行 run_gemini_processor，回報每個請求的未快取輸入 token、
+由 context cache 提供的 token 與模擬的 time-to-first-token (依輸入 token 數估計的 prefill 時間)
+
+使用方式:
+    python benchmarks/bench_gemini_prompt.py
+    python benchmarks/bench_gemini_prompt.py --min-cache-tokens 256   # 假設指令可快取時的上限效益
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_pipeline_gemini as pipeline  # noqa: E402
+from bench_gemini_output import synthetic_frame  # noqa: E402
+from bench_scraper import percentile  # noqa: E402
+from gemini_stub import GeminiStubClient  # noqa: E402
+
+
+def run_mode(mode, df, args):
+    stub = GeminiStubClient(seed=args.seed, pipe_rate=0, quote_rate=0, min_cache_tokens=args.min_cache_tokens)
+    pipeline.set_gemini_client(stub)
+    pipeline.GEMINI_PROMPT_MODE = mode
+    pipeline.GEMINI_OUTPUT_MODE = args.output_mode
+    pipeline._chunk_sizer = None
+
+    results = pipeline.run_gemini_processor(df, "001", "111", args.industry, use_cache=False)
+    stats = stub.stats
+    requests = max(1, stats.requests)
+    return {
+        "mode": mode,
+        "requests": stats.requests,
+        "rows": len(results),
+        "input_tokens": stats.input_tokens / requests,
+        "cached_tokens": stats.cached_tokens / requests,
+        "ttft_p50": percentile(stats.ttft, 50),
+        "ttft_p99": percentile(stats.ttft, 99),
+        "caches": stats.caches_created,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare how the static Gemini instructions are sent, against a local stub client")
+    parser.add_argument("--rows", type=int, default=1500)
+    parser.add_argument("--modes", default="inline,system,cache")
+    parser.add_argument("--industry", default="0008")
+    parser.add_argument("--output-mode", default="json", choices=["json", "csv"])
+    parser.add_argument("--min-cache-tokens", type=int, default=4096,
+                        help="smallest instruction the stub accepts as a context cache (Gemini Pro models: 4096)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pipeline.BUCKET_NAME = None
+    df = synthetic_frame(args.rows)
+    results = [run_mode(mode, df, args) for mode in args.modes.split(",")]
+
+    print(f"\n{args.rows} rows, industry {args.industry}, {args.output_mode} output")
+    print(f"{'mode':<8}{'requests':>9}{'rows':>6}{'input tok/req':>15}{'cached tok/req':>16}"
+          f"{'ttft p50':>10}{'ttft p99':>10}{'caches':>8}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['requests']:>9}{r['rows']:>6}{r['input_tokens']:>15.0f}{r['cached_tokens']:>16.0f}"
+              f"{r['ttft_p50']:>10.3f}{r['ttft_p99']:>10.3f}{r['caches']:>8}")
+
+
+if __name__ == "__main__":
+    main()
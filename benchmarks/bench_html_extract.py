@@ -0,0 +1,113 @@
+"""
+RetailerList 解析 micro-benchmark
+比較舊版 pd.read_html + iterrows 與 nccc_parser.extract_merchant_columns
+
+使用方式:
+    python benchmarks/bench_html_extract.py                 # 使用合成頁面
+    python benchmarks/bench_html_extract.py --pages-dir DIR # 使用存下來的實際頁面 (*.html, Big5 或 UTF-8)
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nccc_parser import MERCHANT_COLUMNS, extract_merchant_columns  # noqa: E402
+from nccc_pages import render_retailer_page, synthetic_merchants  # noqa: E402
+
+
+def legacy_parse(page_html):
+    """The pre-extractor path: parse every table, find 特店名稱, iterrows into dicts."""
+    dfs = pd.read_html(io.StringIO(page_html))
+    target_table = None
+    for t in dfs:
+        if t.shape[1] >= 5 and "特店名稱" in str(t.iloc[0, 0]):
+            target_table = t
+            break
+    rows = []
+    if target_table is None:
+        return rows
+    target_table.columns = target_table.iloc[0]
+    target_table = target_table[1:]
+    for _, row in target_table.iterrows():
+        if str(row.iloc[0]).strip() == "特店名稱": continue
+        rows.append({
+            "特店名稱": str(row.iloc[0]).strip(),
+            "行業別": str(row.iloc[1]).strip(),
+            "電話": str(row.iloc[2]).strip(),
+            "地址": str(row.iloc[3]).strip()
+        })
+    return rows
+
+
+def load_pages(pages_dir):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        raw = open(path, "rb").read()
+        try:
+            pages.append(raw.decode("big5"))
+        except UnicodeDecodeError:
+            pages.append(raw.decode("utf-8", errors="replace"))
+    return pages
+
+
+def run_legacy(pages):
+    return pd.DataFrame([row for p in pages for row in legacy_parse(p)])
+
+
+def run_columnar(pages):
+    columns = {col: [] for col in MERCHANT_COLUMNS}
+    for p in pages:
+        page_columns = extract_merchant_columns(p)
+        if page_columns:
+            for col in MERCHANT_COLUMNS:
+                columns[col].extend(page_columns[col])
+    return pd.DataFrame(columns)
+
+
+def best_of(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(pages)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RetailerList parser micro-benchmark")
+    parser.add_argument("--pages-dir", help="Directory of saved RetailerList pages (*.html)")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic pages to generate")
+    parser.add_argument("--rows", type=int, default=20, help="Merchants per synthetic page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages_dir:
+        pages = load_pages(args.pages_dir)
+    else:
+        merchants = synthetic_merchants(args.pages * args.rows)
+        pages = [render_retailer_page(merchants[i:i + args.rows], page=i // args.rows + 1)
+                 for i in range(0, len(merchants), args.rows)]
+    if not pages:
+        print("No pages to benchmark.")
+        return
+
+    legacy_t, legacy_df = best_of(run_legacy, pages, args.repeat)
+    columnar_t, columnar_df = best_of(run_columnar, pages, args.repeat)
+
+    # 舊版將空白儲存格讀成 "nan"，新版輸出 ""
+    same = legacy_df.replace("nan", "").reset_index(drop=True).equals(columnar_df.reset_index(drop=True))
+    print(f"Pages: {len(pages)}, rows: {len(columnar_df)}, identical output: {same}")
+    print(f"pd.read_html + iterrows : {legacy_t * 1000:8.1f} ms ({legacy_t / len(pages) * 1000:.2f} ms/page)")
+    print(f"extract_merchant_columns: {columnar_t * 1000:8.1f} ms ({columnar_t / len(pages) * 1000:.2f} ms/page)")
+    print(f"Speedup: {legacy_t / columnar_t:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+爬蟲吞吐量 benchmark
+啟動本地 NCCC 替身伺服器 (nccc_stub_server)，以不同並發設定執行 run_scraper_batch，
+回報 pages/sec、rows/sec 與頁面延遲 p50/p99
+
+使用方式:
+    python benchmarks/bench_scraper.py
+    python benchmarks/bench_scraper.py --pages 60 --latency 0.3 --error-rate 0.05 --modes 1,4,8,adaptive
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_pipeline_gemini as pipeline  # noqa: E402
+from nccc_stub_server import StubConfig, start_stub_server  # noqa: E402
+
+
+class LatencyRecorder:
+    """Records the wall time of every HTTP POST made through requests.Session."""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+        self._original = requests.Session.post
+
+    def __enter__(self):
+        recorder = self
+
+        def timed_post(session, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return recorder._original(session, *args, **kwargs)
+            finally:
+                with recorder._lock:
+                    recorder.samples.append(time.perf_counter() - start)
+
+        requests.Session.post = timed_post
+        return self
+
+    def __exit__(self, *exc):
+        requests.Session.post = self._original
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_mode(mode, stub_config):
+    # 每次都從乾淨的自適應狀態開始，且不寫入 GCS
+    pipeline.BUCKET_NAME = None
+    pipeline.RATE_STATE_LOCAL_PATH = os.path.join(tempfile.mkdtemp(), "rate_state.json")
+    pipeline._rate_controller = None
+
+    kwargs = {} if mode == "adaptive" else {"concurrency": int(mode), "rps": 0}
+    requests_before = stub_config.requests
+    with LatencyRecorder() as recorder:
+        start = time.perf_counter()
+        df = pipeline.run_scraper_batch("001", "台北市", "111", "士林區", "0009", "旅宿業", **kwargs)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "seconds": elapsed,
+        "rows": len(df),
+        "requests": stub_config.requests - requests_before,
+        "pages_per_sec": stub_config.pages / elapsed,
+        "rows_per_sec": len(df) / elapsed,
+        "p50": percentile(recorder.samples, 50),
+        "p99": percentile(recorder.samples, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scraper throughput benchmark against a local NCCC stub")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--modes", default="1,4,8,adaptive",
+                        help="Comma separated: fixed concurrency levels (no rate limit) and/or 'adaptive'")
+    args = parser.parse_args()
+
+    stub_config = StubConfig(pages=args.pages, rows_per_page=args.rows, latency=args.latency,
+                             error_rate=args.error_rate)
+    server, url = start_stub_server(stub_config)
+    pipeline.NCCC_URL = url
+
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            results.append(run_mode(mode.strip(), stub_config))
+    finally:
+        server.shutdown()
+
+    print()
+    print(f"Stub: {args.pages} pages x {args.rows} rows, latency {args.latency}s, error rate {args.error_rate}")
+    print(f"{'mode':>9} {'seconds':>8} {'rows':>6} {'requests':>8} {'pages/s':>8} {'rows/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['mode']:>9} {r['seconds']:8.2f} {r['rows']:6d} {r['requests']:8d} {r['pages_per_sec']:8.1f} "
+              f"{r['rows_per_sec']:8.1f} {r['p50'] * 1000:8.1f} {r['p99'] * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
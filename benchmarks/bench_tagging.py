@@ -0,0 +1,148 @@
+"""
+隱藏標籤比對的一致性檢查與效能比較
+1. 以目前的 SYNONYMS_MAP 比對舊版逐品牌迴圈 (含 fuzzy fallback) 與 add_hidden_tags，輸出必須完全相同
+2. 將 SYNONYMS_MAP 擴充到數千個合成品牌，比較 token 比對 (exact-match path) 的
+   逐品牌 `in` 迴圈與 Aho-Corasick 自動機，結果必須相同
+3. 比較 fuzzy fallback 的逐組 fuzz.partial_ratio 與批次 fuzzy_synonym_tags (字元計數預先排除 + cdist)
+
+使用方式:
+    python benchmarks/bench_tagging.py                       # 預設 10,000 個店名
+    python benchmarks/bench_tagging.py --names 50000 --brands 100,1000,5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_pipeline_gemini import add_hidden_tags  # noqa: E402
+from nccc_pages import synthetic_merchants  # noqa: E402
+from pipeline_config import SYNONYMS_MAP  # noqa: E402
+from tag_matcher import build_synonym_matcher, fuzzy_synonym_tags  # noqa: E402
+
+CJK = "台北新店咖啡茶餐廳飯館麵包坊書局旅社商行服飾鞋包藥妝超市電器家具眼鏡珠寶文具花藝美髮健身"
+
+
+def legacy_find_tags(name, synonyms, fuzz=None):
+    """The per-brand loop add_hidden_tags used before the automaton."""
+    if pd.isna(name) or not name: return ""
+    name_proc = str(name).lower()
+    tags = set()
+    for k, v in synonyms.items():
+        v_proc = str(v).lower()
+        for token in v_proc.split():
+            if token in name_proc:
+                tags.add(k)
+                break
+        else:
+            if fuzz and fuzz.partial_ratio(name_proc, v_proc) >= 80:
+                tags.add(k)
+    return ",".join(sorted(tags))
+
+
+def synthetic_synonyms(n, seed=0):
+    """SYNONYMS_MAP plus synthetic brands up to `n` entries (latin and CJK tokens)."""
+    rng = random.Random(seed)
+    synonyms = dict(SYNONYMS_MAP)
+    i = 0
+    while len(synonyms) < n:
+        latin = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 8)))
+        tokens = [latin] + ["".join(rng.choice(CJK) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        synonyms[f"{latin}{i}"] = " ".join(tokens)
+        i += 1
+    return synonyms
+
+
+def synthetic_names(n, synonyms, seed=0):
+    """Merchant names; about a third embed a random synonym token."""
+    rng = random.Random(seed)
+    values = list(synonyms.values())
+    names = [row[0] for row in synthetic_merchants(n, seed=seed)]
+    for i in range(0, n, 3):
+        token = rng.choice(rng.choice(values).split())
+        names[i] = f"{names[i][:3]}{token.upper() if rng.random() < 0.3 else token}{names[i][3:]}"
+    names[::97] = [None] * len(names[::97])
+    return names
+
+
+def check_full_parity(n):
+    try:
+        from rapidfuzz import fuzz
+    except ImportError:
+        fuzz = None
+    names = synthetic_names(n, SYNONYMS_MAP, seed=1)
+    expected = [legacy_find_tags(name, SYNONYMS_MAP, fuzz) for name in names]
+    actual = add_hidden_tags(pd.DataFrame({"特店名稱": names}))["hidden_tags"].tolist()
+    assert actual == expected, next((name, a, e) for name, a, e in zip(names, actual, expected) if a != e)
+    print(f"Parity OK: add_hidden_tags == legacy loop on {n} names (fuzzy={'on' if fuzz else 'off'})")
+
+
+def bench_exact(names, brands):
+    synonyms = synthetic_synonyms(brands)
+    start = time.perf_counter()
+    matcher = build_synonym_matcher(synonyms)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [legacy_find_tags(name, synonyms) for name in names]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [",".join(sorted(matcher.find(str(name).lower()))) if not pd.isna(name) and name else ""
+              for name in names]
+    new_seconds = time.perf_counter() - start
+
+    assert actual == expected
+    print(f"{len(synonyms):>6} brands: legacy {legacy_seconds:7.3f}s  automaton {new_seconds:7.3f}s "
+          f"({legacy_seconds / new_seconds:5.1f}x, build {build_seconds * 1000:.0f} ms, {len(matcher)} states)")
+
+
+def bench_fuzzy(names, synonyms):
+    from rapidfuzz import fuzz
+    names_proc = [str(name).lower() for name in names if not pd.isna(name) and name]
+    values = {k: str(v).lower() for k, v in synonyms.items()}
+
+    start = time.perf_counter()
+    expected = [{k for k, v in values.items() if fuzz.partial_ratio(name, v) >= 80} for name in names_proc]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = fuzzy_synonym_tags(names_proc, synonyms, score_cutoff=80, workers=-1)
+    new_seconds = time.perf_counter() - start
+
+    assert actual == expected
+    print(f"{len(synonyms):>6} brands: per-pair {legacy_seconds:7.3f}s  batched {new_seconds:7.3f}s "
+          f"({legacy_seconds / new_seconds:5.1f}x, {sum(map(len, actual))} fuzzy hits, {os.cpu_count()} cores)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and timing for synonym tag matching")
+    parser.add_argument("--names", type=int, default=10_000)
+    parser.add_argument("--brands", default=f"{len(SYNONYMS_MAP)},500,1000,2000")
+    parser.add_argument("--parity-names", type=int, default=2_000, help="names for the full (fuzzy) parity check")
+    args = parser.parse_args()
+
+    check_full_parity(args.parity_names)
+    print(f"Exact-match path over {args.names} names:")
+    for brands in (int(b) for b in args.brands.split(",")):
+        names = synthetic_names(args.names, synthetic_synonyms(brands))
+        bench_exact(names, brands)
+
+    print(f"Fuzzy path over {args.names} names:")
+    try:
+        import rapidfuzz  # noqa: F401
+    except ImportError:
+        print("rapidfuzz not installed, skipped")
+        return
+    for brands in (int(b) for b in args.brands.split(",")):
+        synonyms = synthetic_synonyms(brands)
+        bench_fuzzy(synthetic_names(args.names, synonyms), synonyms)
+
+
+if __name__ == "__main__":
+    main()
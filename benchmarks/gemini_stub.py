@@ -0,0 +1,161 @@
+"""
+本地 Gemini 替身 client (實作 gemini_client.GeminiClient 介面，不連網路)
+依輸入資料 CSV 為每一列產生結果，並模擬實際輸出常見的問題：
+評論中出現 `|`、評論以引號開頭、開頭語、Markdown 代碼區塊；
+指定 response_schema 時輸出符合 schema 的 JSON 陣列，`schema_supported=False` 則模擬不支援的模型 (回傳 400)。
+context cache 依 TTL 到期，指令 token 數低於 `min_cache_tokens` 時拒絕建立；
+每次請求依未快取與已快取的輸入 token 數模擬 prefill 時間 (time-to-first-token)
+"""
+
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+from google.genai import errors, types
+
+from gemini_client import GeminiClient
+
+CSV_HEADER = "ID|店名|縣市|行政區|地址|樓層|緯度|經度|電話|評論|星級數|價格區間"
+REVIEW_WORDS = ["早午餐", "下午茶", "老字號", "巷弄美食", "CP值高", "服務親切", "環境舒適", "排隊名店", "停車方便", "適合聚餐"]
+
+
+def stub_tokens(text):
+    """Token estimate used by the stub (prompts are mostly CJK: about 0.75 token per character)."""
+    return max(1, int(len(text or "") * 0.75))
+
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.json_requests = 0
+        self.rejected = 0
+        self.token_counts = 0
+        self.rows_requested = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.caches_created = 0
+        self.ttft = []
+        self._lock = threading.Lock()
+
+    def add(self, ttft=None, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+            if ttft is not None:
+                self.ttft.append(ttft)
+
+
+class GeminiStubClient(GeminiClient):
+    """Offline GeminiClient; `*_rate` are per-response (preamble, fence) or per-row (pipe, quote) probabilities.
+
+    Simulated time-to-first-token is `base_ttft` plus `prefill_per_1k`
+    seconds per 1,000 uncached input tokens; cached tokens cost
+    `cached_prefill_factor` of that. Only `latency` is actually slept.
+    """
+
+    model = "gemini-stub"
+
+    def __init__(self, seed=0, latency=0.0, pipe_rate=0.03, quote_rate=0.02, preamble_rate=0.1,
+                 fence_rate=0.1, schema_supported=True, min_cache_tokens=256, base_ttft=0.3,
+                 prefill_per_1k=0.2, cached_prefill_factor=0.1):
+        self.latency = latency
+        self.pipe_rate = pipe_rate
+        self.quote_rate = quote_rate
+        self.preamble_rate = preamble_rate
+        self.fence_rate = fence_rate
+        self.schema_supported = schema_supported
+        self.min_cache_tokens = min_cache_tokens
+        self.base_ttft = base_ttft
+        self.prefill_per_1k = prefill_per_1k
+        self.cached_prefill_factor = cached_prefill_factor
+        self.stats = StubStats()
+        self.caches = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def input_rows(contents):
+        """The rows of the input CSV at the end of the contents."""
+        csv_text = str(contents).split("# 輸入資料", 1)[-1].strip()
+        return pd.read_csv(io.StringIO(csv_text), dtype=str, keep_default_na=False)
+
+    def _record(self, row, rng):
+        words = rng.sample(REVIEW_WORDS, 3)
+        if rng.random() < self.pipe_rate:
+            words[1] = f"{words[1]}|{words[2]}"
+        review = "、".join(words)
+        if rng.random() < self.quote_rate:
+            review = f"\"{words[0]}\"的{review}"
+        return {"id": row["temp_id"], "name": row["特店名稱"], "city": row["縣市"], "district": row["行政區"],
+                "address": row["地址"], "floor": None, "lat": 25.0 + rng.random() / 10, "lng": 121.5 + rng.random() / 10,
+                "phone": f"(02){rng.randint(20000000, 29999999)}", "review_summary": review,
+                "rating": f"{rng.choice([3.8, 4.1, 4.5])}/5", "price_level": str(rng.choice([150, 300, 800]))}
+
+    async def count_tokens(self, contents):
+        self.stats.add(token_counts=1)
+        return stub_tokens(str(contents))
+
+    async def create_cache(self, system_instruction, ttl_seconds, display_name=None):
+        tokens = stub_tokens(system_instruction)
+        if tokens < self.min_cache_tokens:
+            raise errors.ClientError(400, {"error": {
+                "code": 400, "status": "INVALID_ARGUMENT",
+                "message": f"Cached content is too small. total_token_count={tokens}, "
+                           f"min_total_token_count={self.min_cache_tokens}"}})
+        with self._lock:
+            name = f"cachedContents/stub-{len(self.caches) + 1}"
+            expire_time = time.time() + ttl_seconds
+            self.caches[name] = (tokens, expire_time)
+        self.stats.add(caches_created=1)
+        return name, expire_time
+
+    def expire_cache(self, name):
+        """Make a cache expire now (simulates a cache that outlived its TTL on the server)."""
+        with self._lock:
+            if name in self.caches:
+                self.caches[name] = (self.caches[name][0], time.time() - 1)
+
+    async def generate(self, contents, system_instruction=None, cached_content=None, response_schema=None):
+        json_mode = response_schema is not None
+        cached_tokens = 0
+        if cached_content:
+            with self._lock:
+                entry = self.caches.get(cached_content)
+            if entry is None or entry[1] <= time.time():
+                raise errors.ClientError(404, {"error": {
+                    "code": 404, "status": "NOT_FOUND", "message": f"CachedContent not found: {cached_content}"}})
+            cached_tokens = entry[0]
+        input_tokens = stub_tokens(str(contents)) + (stub_tokens(system_instruction) if system_instruction else 0)
+        rows = self.input_rows(contents)
+        ttft = self.base_ttft + self.prefill_per_1k * (input_tokens + cached_tokens * self.cached_prefill_factor) / 1000
+        self.stats.add(requests=1, json_requests=int(json_mode), rows_requested=len(rows), input_tokens=input_tokens,
+                       cached_tokens=cached_tokens, ttft=ttft)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if json_mode and not self.schema_supported:
+            self.stats.add(rejected=1)
+            raise errors.ClientError(400, {"error": {
+                "code": 400, "status": "INVALID_ARGUMENT",
+                "message": "Tool use with a response mime type: 'application/json' is unsupported"}})
+
+        with self._lock:
+            rng = random.Random(self._rng.random())
+        records = [self._record(row, rng) for _, row in rows.iterrows()]
+        if json_mode:
+            text = json.dumps(records, ensure_ascii=False)
+        else:
+            lines = [CSV_HEADER] + ["|".join("" if r[k] is None else str(r[k]) for k in r) for r in records]
+            text = "\n".join(lines)
+            if rng.random() < self.fence_rate:
+                text = f"```csv\n{text}\n```"
+            if rng.random() < self.preamble_rate:
+                text = f"好的，以下是整理後的資料：\n{text}"
+        usage = SimpleNamespace(prompt_token_count=input_tokens + cached_tokens,
+                                cached_content_token_count=cached_tokens or None)
+        candidate = SimpleNamespace(finish_reason=types.FinishReason.STOP)
+        return SimpleNamespace(text=text, candidates=[candidate], usage_metadata=usage)
@@ -0,0 +1,49 @@
+"""
+合成的 NCCC RetailerList 頁面 (供 benchmark 使用)
+版面仿照實際網站：外層排版表格內嵌一個第一列為「特店名稱」標題的特店表格
+"""
+
+import random
+
+ROADS = ["中山北路", "忠孝東路", "信義路", "羅斯福路", "民生東路", "南京西路", "承德路", "和平東路"]
+SECTIONS = ["一段", "二段", "三段", "四段", "五段", ""]
+INDUSTRIES = ["旅宿業", "其他業別-餐飲", "旅行業", "交通運輸業", "觀光遊樂業"]
+BRANDS = ["7-ELEVEN", "全家便利商店", "星巴克", "麥當勞", "路易莎咖啡", "誠品書店", "台北老爺大酒店", ""]
+
+
+def synthetic_merchants(n, seed=0, city_name="台北市", zip_name="士林區"):
+    """Return `n` deterministic (特店名稱, 行業別, 電話, 地址) tuples."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        brand = rng.choice(BRANDS)
+        name = f"{brand}{zip_name[:2]}{i}店" if brand else f"測試商店{i:05d}"
+        phone = f"(02){rng.randint(2000, 2999)}-{rng.randint(0, 9999):04d}"
+        floor = rng.choice(["", "", f"{rng.randint(1, 12)}樓", f"B{rng.randint(1, 3)}"])
+        addr = f"{city_name}{zip_name}{rng.choice(ROADS)}{rng.choice(SECTIONS)}{rng.randint(1, 300)}號{floor}"
+        rows.append((name, rng.choice(INDUSTRIES), phone, addr))
+    return rows
+
+
+def render_retailer_page(rows, page=1):
+    """Render merchant rows as a RetailerList HTML page (text; encode as Big5 to serve)."""
+    body = "".join(
+        "<tr bgcolor=\"#FFFFFF\">"
+        f"<td>{name}</td><td>{ind}</td><td>{phone}</td><td>{addr}</td>"
+        "<td align=\"center\"><a href=\"#\">地圖</a></td></tr>\n"
+        for name, ind, phone, addr in rows
+    )
+    return f"""<html><head><meta http-equiv="Content-Type" content="text/html; charset=big5">
+<title>國民旅遊卡特約商店查詢</title></head><body>
+<table width="100%"><tr><td><img src="logo.gif"></td><td>國民旅遊卡檢核系統</td></tr></table>
+<table width="760" border="0"><tr><td>
+  <table width="100%" border="1" cellpadding="2">
+  <tr bgcolor="#CCCCCC"><td>特店名稱</td><td>行業別</td><td>電話</td><td>地址</td><td>地圖</td></tr>
+{body}  </table>
+</td></tr>
+<tr><td>第 {page} 頁 <a href="#">上一頁</a> <a href="#">下一頁</a></td></tr></table>
+</body></html>"""
+
+
+def render_end_page():
+    return "<html><body><table><tr><td>查無資料</td></tr></table></body></html>"
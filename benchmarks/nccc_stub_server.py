@@ -0,0 +1,124 @@
+"""
+本地 NCCC EntryServlet 替身伺服器
+模擬 RetailerList 端點：回傳 Big5 編碼的合成特店頁面，可設定頁數、延遲、錯誤率，
+最後一頁之後回傳「查無資料」。用於離線量測爬蟲效能，避免對政府網站發送測試流量。
+
+使用方式:
+    python benchmarks/nccc_stub_server.py --port 8099 --pages 40 --latency 0.2 --error-rate 0.02
+    NCCC_URL=http://127.0.0.1:8099/ python data_pipeline_gemini.py --city 001 --zip 111 --industry 0009
+"""
+
+import argparse
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from nccc_pages import render_end_page, render_retailer_page, synthetic_merchants
+
+
+class StubConfig:
+    """Behaviour of the stub; attributes may be changed while the server runs."""
+
+    def __init__(self, pages=20, rows_per_page=20, latency=0.1, jitter=0.5, error_rate=0.0, seed=0):
+        self.pages = pages                  # 每個查詢條件的頁數，之後回傳「查無資料」
+        self.rows_per_page = rows_per_page
+        self.latency = latency              # 平均回應延遲 (秒)
+        self.jitter = jitter                # 延遲在 latency * (1 ± jitter) 之間均勻分布
+        self.error_rate = error_rate        # 回傳 503 的機率
+        self.seed = seed
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def count(self, error):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+
+
+def _make_handler(config):
+    page_cache = {}
+
+    def render(request_val, page):
+        if page > config.pages:
+            return render_end_page().encode("big5")
+        key = (request_val, page)
+        if key not in page_cache:
+            # 同一個 (Request, Page) 永遠產生相同內容
+            seed = zlib.crc32(f"{config.seed}|{request_val}|{page}".encode("utf-8"))
+            rows = synthetic_merchants(config.rows_per_page, seed=seed)
+            page_cache[key] = render_retailer_page(rows, page=page).encode("big5")
+        return page_cache[key]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            form = parse_qs(self.rfile.read(length).decode("utf-8", errors="replace"))
+            request_val = form.get("Request", [""])[0]
+            try:
+                page = int(form.get("Page", ["1"])[0])
+            except ValueError:
+                page = 1
+
+            delay = config.latency * (1 + random.uniform(-config.jitter, config.jitter))
+            time.sleep(max(0.0, delay))
+
+            if random.random() < config.error_rate:
+                config.count(error=True)
+                body = b"Service Unavailable"
+                self.send_response(503)
+            else:
+                config.count(error=False)
+                body = render(request_val, page)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=big5")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(config=None, host="127.0.0.1", port=0):
+    """Start the stub in a daemon thread; returns (server, url). Call server.shutdown() to stop."""
+    config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.stub_config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/NASApp/NTC/servlet/com.du.mvc.EntryServlet"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the NCCC RetailerList endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20, help="Merchants per page")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503 response")
+    args = parser.parse_args()
+
+    config = StubConfig(pages=args.pages, rows_per_page=args.rows, latency=args.latency,
+                        jitter=args.jitter, error_rate=args.error_rate)
+    server, url = start_stub_server(config, args.host, args.port)
+    print(f"NCCC stub listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
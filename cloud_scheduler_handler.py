@@ -136,6 +136,7 @@ def scheduled_pipeline(request):
                     payload = {
                         "mode": "scrape",
                         "config": {
+                            **config,  # 保留其餘選項 (如 delta、爬蟲速率設定)
                             "city": city,
                             "industries": industries,
                             "districts": [zip_code],  # 鎖定單一行政區
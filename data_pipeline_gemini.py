@@ -2,23 +2,42 @@ import os
 import time
 import io
 import re
+import json
 import argparse
 import unicodedata
 import tempfile
+import threading
+import hashlib
+import queue
+import asyncio
 import requests
 import urllib3
 import pandas as pd
 import googlemaps
 import logging
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from google.cloud import storage
-from google.api_core.exceptions import PreconditionFailed
+from google.api_core.exceptions import NotFound
 
 # Local imports
-from pipeline_config import CITIES, ZIP_CODES, INDUSTRY_CODES, SYNONYMS_MAP
+from pipeline_config import CITIES, ZIP_CODES, INDUSTRY_CODES, SYNONYMS_MAP, DISTRICT_BOUNDS
+from rate_limit import AdaptiveRateController, get_host_bucket
+from nccc_parser import MERCHANT_COLUMNS, extract_merchant_columns
+from response_cache import CacheMissError, ResponseCache
+from scrape_delta import PageFingerprints, page_fingerprint
+from address_parser import SUB_NUMBER_PATTERN, SUB_NUMBER_REPLACEMENT, canonical_address, parse_address
+from geocoding_store import GeocodingStore
+from gemini_chunking import AdaptiveChunkSizer, next_chunk_end
+from gemini_client import ContextCacheRegistry, GenAIClient
+from tag_matcher import TagMemo, build_synonym_matcher, fuzzy_synonym_tags, synonyms_hash
+from tag_memo_store import append_tag_memo_delta, load_tag_memo_entries
+from geocoding_shards import (LEGACY_BLOB_NAME, append_geocoding_deltas, is_base, list_cache_blobs,
+                              read_cache_blob)
 
 # ================= 環境配置 =================
 load_dotenv()
@@ -35,11 +54,63 @@ BUCKET_NAME = os.getenv("BUCKET_NAME")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # 檔案名稱設定
-CACHE_BLOB_NAME = "geocoding_cache.parquet"
 # Verify this model name is available in your Gemini API plan
 GEMINI_MODEL_NAME = "gemini-3-pro-preview"
 FRAGMENTS_DIR = "fragments"  # GCS 上的暫存目錄
 
+# 爬蟲設定
+NCCC_URL = os.getenv("NCCC_URL", "https://travel.nccc.com.tw/NASApp/NTC/servlet/com.du.mvc.EntryServlet")  # 可指向本地替身伺服器
+SCRAPER_HEADERS = {"User-Agent": "Mozilla/5.0"}
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "1"))  # 自適應模式的初始在途請求數
+SCRAPER_RPS = float(os.getenv("SCRAPER_RPS", "3"))  # 自適應模式的初始每秒請求數
+SCRAPER_MAX_CONCURRENCY = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "8"))
+SCRAPER_MAX_RPS = float(os.getenv("SCRAPER_MAX_RPS", "20"))
+SCRAPER_SLOW_SECONDS = float(os.getenv("SCRAPER_SLOW_SECONDS", "5"))  # 回應超過此秒數視為過載
+SCRAPER_PAGE_RETRIES = 2  # timeout / 5xx 的重試次數
+SCRAPER_CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR")  # 設定後啟用 HTTP 回應快取
+SCRAPER_CACHE_TTL = int(os.getenv("SCRAPER_CACHE_TTL", str(24 * 3600)))  # 快取有效秒數
+DELTA_LEADING_PAGES = int(os.getenv("DELTA_LEADING_PAGES", "3"))  # 差異爬蟲先比對的前導頁數
+DELTA_FULL_SCRAPE_DAYS = float(os.getenv("DELTA_FULL_SCRAPE_DAYS", "7"))  # 超過此天數強制完整爬取
+SCRAPE_STATE_DIR = "scrape_state"  # GCS 上的頁面指紋目錄
+RATE_STATE_BLOB_NAME = "scraper_rate_state.json"
+RATE_STATE_LOCAL_PATH = os.path.join(tempfile.gettempdir(), RATE_STATE_BLOB_NAME)
+STREAM_BATCH_PAGES = int(os.getenv("STREAM_BATCH_PAGES", "5"))  # 串流模式每批送往清洗/Geocoding 的頁數
+STREAM_PREFETCH_BATCHES = 2  # 爬蟲最多領先下游處理的批次數 (限制記憶體用量)
+
+# Geocoding 設定
+GEOCODE_HOST = "maps.googleapis.com"
+GEOCODE_QPS = float(os.getenv("GEOCODE_QPS", "20"))  # 整個 process 共用的每秒請求上限 (配合 Maps 配額)
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "8"))  # 同時進行的 Geocoding 請求數
+GEOCODE_DB_PATH = os.getenv("GEOCODE_DB_PATH", os.path.join(tempfile.gettempdir(), "geocoding_cache.sqlite"))  # 本地 SQLite 快取
+GEOCODE_LRU_SIZE = int(os.getenv("GEOCODE_LRU_SIZE", "50000"))  # process 內 LRU 筆數
+GEOCODE_RETRY_BASE = float(os.getenv("GEOCODE_RETRY_BASE", "86400"))  # 查無結果的地址第一次重試前等待秒數，之後每次加倍
+GEOCODE_RETRY_MAX = float(os.getenv("GEOCODE_RETRY_MAX", str(30 * 86400)))  # 重試等待上限 (秒)
+GEOCODE_ERROR_RETRY_BASE = float(os.getenv("GEOCODE_ERROR_RETRY_BASE", "3600"))  # API 錯誤 (多為暫時性) 的起始等待秒數
+GEMINI_GEOCODE_BACKFILL = os.getenv("GEMINI_GEOCODE_BACKFILL", "0") == "1"  # 將通過檢查的 Gemini 經緯度寫回 Geocoding 快取
+
+# 隱藏標籤設定
+
+# Gemini 設定
+GEMINI_CHUNK_SIZE = 30  # 每個 chunk 的初始列數上限 (依輸出截斷率自動調整)
+GEMINI_MAX_CHUNK_SIZE = 60  # 自動調整的列數上限
+GEMINI_OUTPUT_MODE = os.getenv("GEMINI_OUTPUT_MODE", "json")  # json: 以 response schema 限定輸出 (模型不支援時自動改用 csv)；csv: 直線分隔的 CSV
+GEMINI_PROMPT_MODE = os.getenv("GEMINI_PROMPT_MODE", "system")  # system: 以 system instruction 送出；cache: 註冊為 context cache (指令需達模型的快取下限，否則改用 system)；inline: 指令與資料合為一個提示
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))  # context cache 存活秒數
+GEMINI_CONTEXT_CACHE_MARGIN = 120  # cache 剩餘秒數低於此值時改建新的
+GEMINI_CHUNK_TOKENS = int(os.getenv("GEMINI_CHUNK_TOKENS", "4000"))  # 每個 chunk 輸入資料的 token 預算 (不含提示規則)
+GEMINI_MAX_RETRIES = 3
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))  # 同時進行的 Gemini 請求數 (依配額調整)
+GEMINI_CACHE = os.getenv("GEMINI_CACHE", "1") == "1"  # 逐列快取 Gemini 結果，輸入未變的特店不再送出
+GEMINI_CACHE_DIR = "gemini_cache"  # GCS 上的 Gemini 結果快取目錄 (每個 cell 一個檔案)
+GEMINI_CACHE_TTL_DAYS = float(os.getenv("GEMINI_CACHE_TTL_DAYS", "30"))  # 快取的評論/星級最多沿用幾天
+ENRICH_STATE_DIR = "enrich_state"  # GCS 上的增量模式狀態 (fragment 每列對應的特店鍵與輸入雜湊)
+
+_thread_local = threading.local()
+
+# SYNONYMS_MAP 同義詞 token 的 Aho-Corasick 自動機 (import 時建立一次)
+_SYNONYM_MATCHER = build_synonym_matcher(SYNONYMS_MAP)
+_SYNONYMS_HASH = synonyms_hash(SYNONYMS_MAP)
+
 # 設定 Gemini SDK Client
 client = None
 if GOOGLE_API_KEY:
@@ -49,6 +120,19 @@ if GOOGLE_API_KEY:
 if os.path.exists("service_account.json"):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.abspath("service_account.json")
 
+# ================= GCS Client =================
+
+_storage_client = None
+_storage_client_lock = threading.Lock()
+
+def get_gcs_bucket():
+    """Bucket handle on a process-wide storage.Client (created on first use)."""
+    global _storage_client
+    with _storage_client_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+    return _storage_client.bucket(BUCKET_NAME)
+
 # ================= 並行寫入輔助函數 =================
 
 def acquire_lock(lock_path, timeout=30, poll=0.2):
@@ -109,153 +193,601 @@ def atomic_write_parquet(path, df, tmp_suffix=None, timeout=30):
     finally:
         release_lock(fd, lock_path)
 
-def _upload_geocoding_cache_safe(blob, new_cache_rows, tmp_cache_path, max_retries=5):
-    """Upload new geocoding results to GCS with optimistic locking.
-
-    Uses GCS object generation to detect concurrent writes. If another
-    process updated the cache between our read and write, we re-download
-    the latest version, merge again, and retry.
-    """
-    new_df = pd.DataFrame(new_cache_rows)
+# ================= 1. 爬蟲模組 =================
 
-    for attempt in range(max_retries):
+def _load_rate_state():
+    """Load the last saved AIMD state (GCS first so parallel workers share it, then local)."""
+    if BUCKET_NAME:
         try:
-            # 1. Download the latest cache and record its generation
+            blob = get_gcs_bucket().blob(RATE_STATE_BLOB_NAME)
             if blob.exists():
-                blob.reload()
-                generation = blob.generation
-                cache_df = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
-            else:
-                generation = 0
-                cache_df = pd.DataFrame(columns=['full_address_key', 'lat', 'lng'])
-
-            # 2. Merge our new results into the latest cache
-            merged = pd.concat([cache_df, new_df], ignore_index=True)
-            merged.drop_duplicates(subset=['full_address_key'], keep='last', inplace=True)
-
-            # 3. Write to local temp file
-            merged.to_parquet(tmp_cache_path, index=False)
-
-            # 4. Upload with generation match (optimistic lock)
-            blob.upload_from_filename(
-                tmp_cache_path,
-                if_generation_match=generation
-            )
-            print(f"[INFO] Geocoding cache updated ({len(merged)} entries)")
-            return True
-
-        except PreconditionFailed:
-            print(f"[WARN] Geocoding cache conflict (attempt {attempt + 1}/{max_retries}), retrying...")
-            time.sleep(0.5 * (attempt + 1))
+                return json.loads(blob.download_as_text())
         except Exception as e:
-            print(f"[WARN] Failed to upload geocoding cache: {e}")
-            return False
-
-    print("[WARN] Geocoding cache update failed after max retries, results saved locally only")
-    return False
+            print(f"[WARN] Failed to load scraper rate state from GCS: {e}")
+    try:
+        with open(RATE_STATE_LOCAL_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
 
-# ================= 1. 爬蟲模組 =================
+def _save_rate_state(controller):
+    state = controller.to_dict()
+    try:
+        tmp_path = f"{RATE_STATE_LOCAL_PATH}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, RATE_STATE_LOCAL_PATH)
+    except Exception as e:
+        print(f"[WARN] Failed to save scraper rate state locally: {e}")
+    if BUCKET_NAME:
+        try:
+            blob = get_gcs_bucket().blob(RATE_STATE_BLOB_NAME)
+            blob.upload_from_string(json.dumps(state), content_type="application/json")
+        except Exception as e:
+            print(f"[WARN] Failed to save scraper rate state to GCS: {e}")
+
+_rate_controller = None
+_rate_controller_lock = threading.Lock()
+
+def get_rate_controller():
+    """Return the process-wide AIMD controller shared by every NCCC page request, seeded from the last run's state."""
+    global _rate_controller
+    with _rate_controller_lock:
+        if _rate_controller is None:
+            _rate_controller = AdaptiveRateController(
+                rate=SCRAPER_RPS, concurrency=SCRAPER_CONCURRENCY,
+                max_rate=SCRAPER_MAX_RPS, max_concurrency=SCRAPER_MAX_CONCURRENCY,
+                slow_threshold=SCRAPER_SLOW_SECONDS)
+            state = _load_rate_state()
+            if state:
+                _rate_controller.load_dict(state)
+                print(f"[INFO] Resuming scraper at rate={_rate_controller.rate:.2f} req/s, concurrency={_rate_controller.concurrency}")
+        return _rate_controller
+
+def make_response_cache(cache_dir=None, ttl=None, replay=False):
+    """Build the optional ResponseCache (None when no cache directory is configured)."""
+    cache_dir = cache_dir or SCRAPER_CACHE_DIR
+    if not cache_dir:
+        if replay:
+            raise ValueError("Replay mode requires a cache directory (--cache_dir or SCRAPER_CACHE_DIR)")
+        return None
+    return ResponseCache(cache_dir, ttl=SCRAPER_CACHE_TTL if ttl is None else ttl, replay=replay)
+
+def _fetch_retailer_page(request_val, page, limiter, stop_event=None, cache=None):
+    """POST one RetailerList page (retrying throttling errors, via `cache` if given) and return the HTML, None if stopped."""
+    if cache is not None:
+        body = cache.get(request_val, page)
+        if body is not None or cache.replay:
+            return body
+
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+
+    payload = {"Action": "RetailerList", "Type": "GetFull", "WebMode": "", "Request": request_val, "Page": str(page)}
+    for attempt in range(SCRAPER_PAGE_RETRIES + 1):
+        limiter.acquire()
+        if stop_event is not None and stop_event.is_set():
+            limiter.release(outcome="error")
+            return None
+
+        start = time.monotonic()
+        try:
+            # verify=False: government website (travel.nccc.com.tw) has SSL certificate issues
+            resp = session.post(NCCC_URL, data=payload, headers=SCRAPER_HEADERS, timeout=20, verify=False)
+        except (requests.Timeout, requests.ConnectionError):
+            limiter.release(time.monotonic() - start, "throttled")
+            if attempt < SCRAPER_PAGE_RETRIES: continue
+            raise
+        except Exception:
+            limiter.release(time.monotonic() - start, "error")
+            raise
 
-def run_scraper_batch(city_code, city_name, zip_code, zip_name, ind_code, ind_name, max_limit=None):
-    print(f"[INFO] Scraping {city_name} {zip_name} - {ind_name} ({ind_code})...")
-    url = "https://travel.nccc.com.tw/NASApp/NTC/servlet/com.du.mvc.EntryServlet"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    
-    all_data = []
-    page = 1
+        latency = time.monotonic() - start
+        if resp.status_code >= 500 or resp.status_code == 429:
+            limiter.release(latency, "throttled")
+            if attempt < SCRAPER_PAGE_RETRIES: continue
+        else:
+            limiter.release(latency, "ok" if resp.ok else "error")
+        resp.raise_for_status()
+        resp.encoding = "big5"
+        if cache is not None:
+            cache.put(request_val, page, resp.text)
+        return resp.text
+
+def _make_request_val(city_code, zip_code, ind_code):
+    return f"NULL_NULL_NULL_{city_code}_{zip_code}_NULL_{ind_code}_NULL_NULL_0_0_2_2000_0"
+
+def _get_page_limiter(concurrency=None, rps=None):
+    """Return (limiter, pool_size, adaptive) for the given fixed settings, or the AIMD controller if none."""
+    if concurrency is None and rps is None:
+        limiter = get_rate_controller()
+        return limiter, limiter.max_concurrency, True
+    concurrency = max(1, int(concurrency or SCRAPER_CONCURRENCY))
+    rps = SCRAPER_RPS if rps is None else float(rps)
+    return get_host_bucket(NCCC_URL, rps, capacity=concurrency), concurrency, False
+
+def iter_retailer_pages(request_val, concurrency=None, rps=None, cache=None, start_page=1):
+    """Yield (page, page_columns) for each non-empty RetailerList page, in page order."""
+    limiter, pool_size, adaptive = _get_page_limiter(concurrency, rps)
+    stop_event = threading.Event()
+    cache_stats = (cache.hits, cache.misses) if cache is not None else None
+
+    page = start_page
+    next_page = start_page
     empty_count = 0
+    in_flight = {}
 
     try:
-        while True:
-            if max_limit and len(all_data) >= max_limit: break
-
-            request_val = f"NULL_NULL_NULL_{city_code}_{zip_code}_NULL_{ind_code}_NULL_NULL_0_0_2_2000_0"
-            payload = {"Action": "RetailerList", "Type": "GetFull", "WebMode": "", "Request": request_val, "Page": str(page)}
-
+        with ThreadPoolExecutor(max_workers=pool_size) as pool:
             try:
-                # verify=False: government website (travel.nccc.com.tw) has SSL certificate issues
-                resp = requests.post(url, data=payload, headers=headers, timeout=20, verify=False)
-                resp.raise_for_status()
-                resp.encoding = "big5"
-                if "查無資料" in resp.text or "查無特店資訊" in resp.text: break
-
-                dfs = pd.read_html(io.StringIO(resp.text))
-                target_table = None
-                for t in dfs:
-                    if t.shape[1] >= 5 and "特店名稱" in str(t.iloc[0, 0]):
-                        target_table = t
+                while True:
+                    # 維持 concurrency 個頁面在途 (預先抓取後續頁面；自適應模式下隨控制器調整)
+                    window = limiter.concurrency if adaptive else pool_size
+                    while len(in_flight) < max(1, window):
+                        in_flight[next_page] = pool.submit(_fetch_retailer_page, request_val, next_page, limiter, stop_event, cache)
+                        next_page += 1
+
+                    future = in_flight.pop(page)
+                    try:
+                        page_columns = extract_merchant_columns(future.result())
+                        if page_columns is None: break
+
+                        if not page_columns["特店名稱"]:
+                            empty_count += 1
+                            if empty_count >= 3: break
+                        else:
+                            empty_count = 0
+                            yield page, page_columns
+
+                    except CacheMissError as e:
+                        print(f"[WARN] {e}, stopping replay.")
                         break
+                    except Exception as e:
+                        print(f"[ERROR] Page {page}: {e}")
 
-                if target_table is None:
-                    empty_count += 1
-                    if empty_count >= 3: break
-                else:
-                    empty_count = 0
-                    target_table.columns = target_table.iloc[0]
-                    target_table = target_table[1:]
-                    for _, row in target_table.iterrows():
-                        if str(row.iloc[0]).strip() == "特店名稱": continue
-                        all_data.append({
-                            "縣市": city_name,
-                            "行政區": zip_name,
-                            "特店名稱": str(row.iloc[0]).strip(),
-                            "行業別": str(row.iloc[1]).strip(),
-                            "電話": str(row.iloc[2]).strip(),
-                            "地址": str(row.iloc[3]).strip()
-                        })
-                    if page % 5 == 0:
-                        print(f"[INFO] Page {page}, Collected {len(all_data)} items so far...")
-            
-            except Exception as e:
-                print(f"[ERROR] Page {page}: {e}")
+                    page += 1
+            finally:
+                # 停止條件成立：取消尚未開始的預抓頁面
+                stop_event.set()
+                for f in in_flight.values():
+                    f.cancel()
 
-            page += 1
-            time.sleep(0.3)
-            
     except Exception as e:
         print(f"[ERROR] Scraper Batch Error: {e}")
 
-    return pd.DataFrame(all_data)
+    finally:
+        if adaptive and not (cache is not None and cache.replay):
+            _save_rate_state(limiter)
+        if cache is not None:
+            print(f"[INFO] Response cache: {cache.hits - cache_stats[0]} hits, {cache.misses - cache_stats[1]} misses")
+
+def _describe_limiter(concurrency=None, rps=None):
+    limiter, pool_size, adaptive = _get_page_limiter(concurrency, rps)
+    if adaptive:
+        return f"adaptive: rate={limiter.rate:.2f}, concurrency={limiter.concurrency}"
+    return f"concurrency={pool_size}, rps={limiter.rate}"
+
+def run_scraper_batch(city_code, city_name, zip_code, zip_name, ind_code, ind_name, max_limit=None,
+                      concurrency=None, rps=None, cache=None):
+    """Scrape every RetailerList page of one city/district/industry cell into a DataFrame."""
+    print(f"[INFO] Scraping {city_name} {zip_name} - {ind_name} ({ind_code})... [{_describe_limiter(concurrency, rps)}]")
+    request_val = _make_request_val(city_code, zip_code, ind_code)
+
+    columns = {col: [] for col in MERCHANT_COLUMNS}
+    pages = iter_retailer_pages(request_val, concurrency=concurrency, rps=rps, cache=cache)
+    try:
+        for page, page_columns in pages:
+            for col in MERCHANT_COLUMNS:
+                columns[col].extend(page_columns[col])
+            if page % 5 == 0:
+                print(f"[INFO] Page {page}, Collected {len(columns['特店名稱'])} items so far...")
+            if max_limit and len(columns["特店名稱"]) >= max_limit: break
+    finally:
+        pages.close()
+
+    if not columns["特店名稱"]:
+        return pd.DataFrame()
+    # 整個 batch 只建立一次 DataFrame
+    return pd.DataFrame({"縣市": city_name, "行政區": zip_name, **columns})
+
+def iter_scraper_batches(city_code, city_name, zip_code, zip_name, ind_code, ind_name, max_limit=None,
+                         concurrency=None, rps=None, cache=None, batch_pages=None):
+    """Streaming variant of `run_scraper_batch`: yield one DataFrame per `batch_pages` pages."""
+    batch_pages = max(1, int(batch_pages or STREAM_BATCH_PAGES))
+    print(f"[INFO] Streaming {city_name} {zip_name} - {ind_name} ({ind_code})... "
+          f"[{_describe_limiter(concurrency, rps)}, {batch_pages} pages/batch]")
+    request_val = _make_request_val(city_code, zip_code, ind_code)
+    batches = queue.Queue(maxsize=STREAM_PREFETCH_BATCHES)
+    stop_event = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        columns = {col: [] for col in MERCHANT_COLUMNS}
+        collected = 0
+        pending_pages = 0
+        pages = iter_retailer_pages(request_val, concurrency=concurrency, rps=rps, cache=cache)
+        try:
+            for page, page_columns in pages:
+                for col in MERCHANT_COLUMNS:
+                    columns[col].extend(page_columns[col])
+                pending_pages += 1
+                collected += len(page_columns["特店名稱"])
+                if page % 5 == 0:
+                    print(f"[INFO] Page {page}, Collected {collected} items so far...")
+                if max_limit and collected >= max_limit: break
+                if pending_pages >= batch_pages:
+                    if not put(pd.DataFrame({"縣市": city_name, "行政區": zip_name, **columns})): return
+                    columns = {col: [] for col in MERCHANT_COLUMNS}
+                    pending_pages = 0
+            if columns["特店名稱"]:
+                put(pd.DataFrame({"縣市": city_name, "行政區": zip_name, **columns}))
+        except Exception as e:
+            print(f"[ERROR] Streaming scraper error: {e}")
+        finally:
+            pages.close()
+            put(done)
+
+    producer = threading.Thread(target=produce, name=f"scraper-{city_code}_{zip_code}_{ind_code}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done: break
+            yield batch
+    finally:
+        stop_event.set()
+        producer.join()
+
+def _fingerprint_paths(file_suffix, output_dir):
+    filename = f"fingerprints_{file_suffix}.json"
+    return os.path.join(output_dir, filename), f"{SCRAPE_STATE_DIR}/{filename}"
+
+def load_page_fingerprints(file_suffix, output_dir):
+    """Load the previous run's PageFingerprints for a cell (GCS first, then output_dir)."""
+    local_path, blob_name = _fingerprint_paths(file_suffix, output_dir)
+    data = None
+    if BUCKET_NAME:
+        try:
+            blob = get_gcs_bucket().blob(blob_name)
+            if blob.exists():
+                data = json.loads(blob.download_as_text())
+        except Exception as e:
+            print(f"[WARN] Failed to load page fingerprints from GCS: {e}")
+    if data is None and os.path.exists(local_path):
+        try:
+            with open(local_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            data = None
+    return PageFingerprints.from_dict(data) if data else None
+
+def save_page_fingerprints(state, file_suffix, output_dir):
+    local_path, blob_name = _fingerprint_paths(file_suffix, output_dir)
+    payload = json.dumps(state.to_dict())
+    try:
+        tmp_path = f"{local_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, local_path)
+    except Exception as e:
+        print(f"[WARN] Failed to save page fingerprints locally: {e}")
+    if BUCKET_NAME:
+        try:
+            blob = get_gcs_bucket().blob(blob_name)
+            blob.upload_from_string(payload, content_type="application/json")
+        except Exception as e:
+            print(f"[WARN] Failed to save page fingerprints to GCS: {e}")
+
+def _probe_tail_unchanged(request_val, previous, limiter, cache=None):
+    """Cheap tail check: the last known page is identical and the page after it is the end of the list."""
+    last_page = previous.page_count
+    try:
+        last_columns = extract_merchant_columns(_fetch_retailer_page(request_val, last_page, limiter, cache=cache))
+        if last_columns is None or page_fingerprint(last_columns) != previous.fingerprint(last_page):
+            return False
+        next_columns = extract_merchant_columns(_fetch_retailer_page(request_val, last_page + 1, limiter, cache=cache))
+        return next_columns is None or not next_columns["特店名稱"]
+    except Exception as e:
+        print(f"[WARN] Tail probe failed: {e}")
+        return False
+
+def run_delta_scraper_batch(city_code, city_name, zip_code, zip_name, ind_code, ind_name, previous=None,
+                            concurrency=None, rps=None, cache=None, leading_pages=None):
+    """Scrape a cell, stopping early if its pages match the previous fingerprints; returns (df, state, summary)."""
+    leading_pages = leading_pages or DELTA_LEADING_PAGES
+    request_val = _make_request_val(city_code, zip_code, ind_code)
+    print(f"[INFO] Delta scraping {city_name} {zip_name} - {ind_name} ({ind_code})... [{_describe_limiter(concurrency, rps)}]")
+
+    usable = (previous is not None and previous.request_val == request_val and previous.page_count > 0
+              and time.time() - (previous.full_scrape_at or 0) < DELTA_FULL_SCRAPE_DAYS * 86400)
+    if previous is not None and not usable:
+        print("[INFO] Previous fingerprints are missing or stale, doing a full scrape.")
+
+    state = PageFingerprints(request_val)
+    columns = {col: [] for col in MERCHANT_COLUMNS}
+
+    def collect(page, page_columns):
+        state.add_page(page, page_columns)
+        for col in MERCHANT_COLUMNS:
+            columns[col].extend(page_columns[col])
+
+    start_page = 1
+    if usable:
+        check_pages = min(leading_pages, previous.page_count)
+        leading_match = True
+        pages = iter_retailer_pages(request_val, concurrency=concurrency, rps=rps, cache=cache)
+        try:
+            for page, page_columns in pages:
+                collect(page, page_columns)
+                if state.fingerprint(page) != previous.fingerprint(page):
+                    leading_match = False
+                    break
+                if page >= check_pages: break
+        finally:
+            pages.close()
+        start_page = state.page_count + 1
+
+        if leading_match and start_page > check_pages and _probe_tail_unchanged(request_val, previous, _get_page_limiter(concurrency, rps)[0], cache):
+            print(f"[INFO] {zip_name} - {ind_name}: first {check_pages} pages and tail unchanged, stopping early.")
+            summary = {"unchanged": True, "full": False, "pages_fetched": check_pages + 2, "changed_rows": 0,
+                       "removed_rows": 0}
+            return pd.DataFrame(), previous, summary
+
+    if start_page > 1:
+        pages = iter_retailer_pages(request_val, concurrency=concurrency, rps=rps, cache=cache, start_page=start_page)
+    else:
+        # 前導頁抓取不完整，從頭重新抓
+        state = PageFingerprints(request_val)
+        columns = {col: [] for col in MERCHANT_COLUMNS}
+        pages = iter_retailer_pages(request_val, concurrency=concurrency, rps=rps, cache=cache)
+    try:
+        for page, page_columns in pages:
+            collect(page, page_columns)
+            if page % 5 == 0:
+                print(f"[INFO] Page {page}, Collected {len(columns['特店名稱'])} items so far...")
+    finally:
+        pages.close()
+
+    # 回傳完整清單：由 enrich_cell 比對上次的 fragment，只送出新增/變動的特店並移除已下架的特店
+    df = pd.DataFrame({"縣市": city_name, "行政區": zip_name, **columns}) if columns["特店名稱"] else pd.DataFrame()
+    known = previous.row_hashes if usable else set()
+    if usable:
+        # 只有完整爬取才重設 DELTA_FULL_SCRAPE_DAYS 的計時
+        state.full_scrape_at = previous.full_scrape_at
+
+    summary = {
+        "unchanged": False,
+        "full": not usable,
+        "pages_fetched": state.page_count,
+        "changed_rows": len(state.row_hashes - known) if known else len(df),
+        "removed_rows": len(known - state.row_hashes),
+    }
+    print(f"[INFO] Delta result: {summary['changed_rows']} new/changed rows, {summary['removed_rows']} removed rows")
+    return df, state, summary
+
+def _normalize_industry_label(label):
+    return unicodedata.normalize('NFKC', str(label)).replace(" ", "").strip()
+
+def _industry_label_lookup():
+    """Map 行業別 labels shown on the site to INDUSTRY_CODES codes (full name or the part after 其他業別-)."""
+    lookup = {}
+    for code, name in INDUSTRY_CODES.items():
+        name = _normalize_industry_label(name)
+        lookup[name] = code
+        if name.startswith("其他業別-"):
+            lookup.setdefault(name.split("-", 1)[1], code)
+    return lookup
+
+def split_by_industry(df, ind_codes):
+    """Route a district-wide scrape to {ind_code: DataFrame} using the 行業別 column."""
+    if df.empty:
+        return {ind_code: pd.DataFrame() for ind_code in ind_codes}
+
+    lookup = _industry_label_lookup()
+    labels = df['行業別'].map(lambda x: lookup.get(_normalize_industry_label(x)))
+    unknown = df.loc[labels.isna(), '行業別'].unique()
+    if len(unknown):
+        print(f"[WARN] Unrecognized 行業別 labels (dropped): {list(unknown)[:10]}")
+
+    frames = {}
+    for ind_code in ind_codes:
+        part = df[labels == ind_code]
+        frames[ind_code] = part.reset_index(drop=True) if not part.empty else pd.DataFrame()
+    return frames
+
+def run_scraper_district(city_code, city_name, zip_code, zip_name, ind_codes,
+                         concurrency=None, rps=None, cache=None):
+    """Scrape a whole district in one pass (industry field NULL) and split it per industry."""
+    df = run_scraper_batch(city_code, city_name, zip_code, zip_name, "NULL", "全部行業",
+                           concurrency=concurrency, rps=rps, cache=cache)
+    frames = split_by_industry(df, ind_codes)
+    print(f"[INFO] {zip_name}: {len(df)} merchants split into " +
+          ", ".join(f"{ind_code}={len(frames[ind_code])}" for ind_code in ind_codes))
+    return frames
 
 # ================= 2. 清洗與處理模組 =================
 
-def run_cleaner(df):
+# 清洗用的替換表與 regex 只建立一次 (依序套用，順序與原本逐筆處理相同)
+# 字串運算在 Arrow 字串型別上執行 (C++ kernel，regex 由 RE2 每欄編譯一次)，結束後轉回 object
+_ARROW_STRING = "string[pyarrow]"
+_SPACE_REPLACEMENTS = {" ": "", "　": ""}
+_TEXT_REPLACEMENTS = {**_SPACE_REPLACEMENTS, "臺": "台", '一段': '1段', '二段': '2段', '三段': '3段', '至': '-', '之': '-'}
+# 依序去除縣市、鄉鎮市區、村里前綴 (與三次獨立的 re.sub 等價：每組皆 greedy 且後面的組可省略)
+_ADMIN_PREFIX_PATTERN = r'^(?:.{2,3}[縣市])?(?:.{2,4}[鄉鎮市區])?(?:.{2,4}[村里])?'
+# 等同 Python 的 \D (Unicode 非十進位數字)
+_NON_DIGIT_PATTERN = r'[^\p{Nd}]+'
+
+def _normalize_series(series, replacements):
+    series = series.fillna("").astype(str).str.normalize('NFKC').astype(_ARROW_STRING)
+    for k, v in replacements.items():
+        series = series.str.replace(k, v, regex=False)
+    return series
+
+def _clean_text_series(series):
+    series = _normalize_series(series, _TEXT_REPLACEMENTS).str.replace(_ADMIN_PREFIX_PATTERN, '', regex=True)
+    return series.astype(object)
+
+def _clean_address_series(series):
+    # 「12號之3 5樓」去除空白前先改寫成 12-3號 (Arrow regex 不支援 lookahead，以 object 字串處理)
+    series = series.fillna("").astype(str).str.normalize('NFKC')
+    return _clean_text_series(series.str.replace(SUB_NUMBER_PATTERN, SUB_NUMBER_REPLACEMENT, regex=True))
+
+def _digits_only(series):
+    return series.str.replace(_NON_DIGIT_PATTERN, '', regex=True)
+
+def _clean_phone_series(series):
+    series = _normalize_series(series, _SPACE_REPLACEMENTS)
+    cleaned = _digits_only(series).astype(object)
+    # 有分機：「#」前只保留數字，「#」之後保持原樣
+    has_ext = series.str.contains('#', regex=False).astype(bool)
+    if has_ext.any():
+        parts = series[has_ext].astype(object).str.split('#', n=1)
+        main = _digits_only(parts.str[0].astype(_ARROW_STRING)).astype(object)
+        cleaned[has_ext] = main + '#' + parts.str[1]
+    return cleaned, has_ext
+
+def _address_keys(df, with_floor=False):
+    """canonical_address for every row, filling in the row's 縣市/行政區 when the address omits them."""
+    cities = df['縣市'] if '縣市' in df.columns else [""] * len(df)
+    districts = df['行政區'] if '行政區' in df.columns else [""] * len(df)
+    return pd.Series([canonical_address(addr, str(city or ""), str(dist or ""), with_floor=with_floor)
+                      for addr, city, dist in zip(df['地址'], cities, districts)], index=df.index, dtype=object)
+
+def run_cleaner(df, seen_keys=None):
+    """Normalise name/address/phone and drop duplicate merchants (also those whose key is in `seen_keys`)."""
     if df.empty: return df
 
-    def clean_text(text):
-        if pd.isna(text): return ""
-        text = unicodedata.normalize('NFKC', str(text))
-        text = text.replace(" ", "").replace("　", "").replace("臺", "台")
-        replacements = {'一段': '1段', '二段': '2段', '三段': '3段', '至': '-', '之': '-'}
-        for k, v in replacements.items(): text = text.replace(k, v)
-        text = re.sub(r'^.{2,3}[縣市]', '', text)
-        text = re.sub(r'^.{2,4}[鄉鎮市區]', '', text)
-        text = re.sub(r'^.{2,4}[村里]', '', text)
-        return text
-
-    def clean_phone(text):
-        if pd.isna(text): return ""
-        text = unicodedata.normalize('NFKC', str(text))
-        text = text.replace(" ", "").replace("　", "")
-        if '#' in text:
-            parts = text.split('#', 1)
-            main = re.sub(r'\D', '', parts[0])
-            ext = parts[1]
-            return f"{main}#{ext}"
-        else:
-            return re.sub(r'\D', '', text)
+    df['特店名稱'] = _clean_text_series(df['特店名稱'])
+    df['地址'] = _clean_address_series(df['地址'])
 
-    for col in ['特店名稱', '地址']:
-        df[col] = df[col].apply(clean_text)
-    
-    df['電話'] = df['電話'].apply(clean_phone)
+    df['電話'], has_ext = _clean_phone_series(df['電話'])
 
-    # Dedup (注：f-string 內不能包含反斜線，改用字符串拼接)
-    df['dedup_key'] = df.apply(lambda row: re.sub(r'\D', '', row['電話']) + '_' + row['地址'], axis=1)
+    # Dedup (電話的數字部分 + 標準化地址 (含樓層)；無分機的電話清洗後已只剩數字)
+    phone_digits = df['電話'].copy()
+    if has_ext.any():
+        phone_digits[has_ext] = _digits_only(phone_digits[has_ext].astype(_ARROW_STRING)).astype(object)
+    df['dedup_key'] = phone_digits + '_' + _address_keys(df, with_floor=True)
     df.drop_duplicates(subset=['dedup_key'], keep='first', inplace=True)
+    if seen_keys is not None:
+        df = df[~df['dedup_key'].isin(seen_keys)]
+        seen_keys.update(df['dedup_key'])
     return df.drop(columns=['dedup_key'])
 
-def run_geocoder_with_cache(df, tmp_cache_path=None):
+def sync_geocoding_store(store, bucket):
+    """Merge GCS cache objects that changed since the last sync into the local store."""
+    blobs = list_cache_blobs(bucket)
+    if not any(is_base(b.name) for b in blobs):
+        legacy_blob = bucket.blob(LEGACY_BLOB_NAME)
+        try:
+            legacy_blob.reload()
+            blobs.insert(0, legacy_blob)
+        except NotFound:
+            pass
+
+    synced = store.get_meta_prefix("gcs:")
+    fetched = entries = 0
+    for blob in blobs:
+        meta_key = f"gcs:{blob.name}"
+        if synced.pop(meta_key, None) == str(blob.generation):
+            continue
+        entries += store.put_dataframe(read_cache_blob(blob, canonicalize=blob.name == LEGACY_BLOB_NAME))
+        store.set_meta(meta_key, blob.generation)
+        fetched += 1
+    # 剩下的是已被 compaction 刪除的 delta
+    if synced:
+        store.delete_meta(synced)
+    if fetched:
+        print(f"[INFO] Geocoding store synced {fetched} changed GCS objects ({entries} entries)")
+
+def publish_geocoding_rows(store, bucket, rows, tmp_cache_path=None):
+    """Append new cache rows (already in `store`) to GCS and mark the deltas as synced."""
+    uploaded = append_geocoding_deltas(bucket, rows, tmp_cache_path)
+    for name, generation in uploaded.items():
+        if generation is not None:
+            store.set_meta(f"gcs:{name}", generation)
+
+_geocoding_store = None
+_geocoding_store_lock = threading.Lock()
+
+def get_geocoding_store(bucket=None):
+    """Return the process-wide GeocodingStore, revalidated against the GCS cache."""
+    global _geocoding_store
+    with _geocoding_store_lock:
+        if _geocoding_store is None or _geocoding_store.db_path != GEOCODE_DB_PATH:
+            _geocoding_store = GeocodingStore(GEOCODE_DB_PATH, lru_size=GEOCODE_LRU_SIZE)
+        if BUCKET_NAME:
+            try:
+                sync_geocoding_store(_geocoding_store, bucket or get_gcs_bucket())
+            except Exception as e:
+                print(f"[WARN] Failed to sync geocoding cache from GCS, using local store only: {e}")
+        return _geocoding_store
+
+def _geocode_one(address, bucket):
+    gmaps = getattr(_thread_local, "gmaps", None)
+    if gmaps is None:
+        gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
+        _thread_local.gmaps = gmaps
+    bucket.acquire()
+    res = gmaps.geocode(address)
+    if not res:
+        return None
+    loc = res[0]['geometry']['location']
+    return loc['lat'], loc['lng']
+
+def geocode_retry_delay(reason, attempts):
+    """Seconds to wait before retrying a failed address: exponential backoff capped at GEOCODE_RETRY_MAX."""
+    base = GEOCODE_RETRY_BASE if reason == "not_found" else GEOCODE_ERROR_RETRY_BASE
+    return min(base * 2 ** max(attempts - 1, 0), GEOCODE_RETRY_MAX)
+
+def geocode_addresses(addresses):
+    """Resolve addresses via the Geocoding API; returns ({address: (lat, lng)}, {address: reason})."""
+    if not addresses:
+        return {}, {}
+    bucket = get_host_bucket(GEOCODE_HOST, GEOCODE_QPS)
+    resolved = {}
+    failed = {}
+    not_found = errors = 0
+    total = len(addresses)
+    progress_every = max(10, total // 10)
+    start = time.monotonic()
+    print(f"[INFO] Resolving {total} addresses via API... [workers={GEOCODE_WORKERS}, qps={GEOCODE_QPS}]")
+
+    with ThreadPoolExecutor(max_workers=max(1, GEOCODE_WORKERS)) as pool:
+        futures = {pool.submit(_geocode_one, addr, bucket): addr for addr in addresses}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+                if result is None:
+                    not_found += 1
+                    failed[futures[future]] = "not_found"
+                else:
+                    resolved[futures[future]] = result
+            except Exception as e:
+                errors += 1
+                failed[futures[future]] = f"error: {type(e).__name__}: {e}"[:200]
+                if errors <= 3:
+                    print(f"[WARN] Geocoding failed for {futures[future]}: {e}")
+            if done % progress_every == 0 or done == total:
+                print(f"[INFO] Geocoding progress: {done}/{total} (resolved {len(resolved)}, not found {not_found}, errors {errors})")
+
+    elapsed = time.monotonic() - start
+    print(f"[INFO] Geocoded {len(resolved)}/{total} addresses in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.1f} req/s), not found {not_found}, errors {errors}")
+    return resolved, failed
+
+def run_geocoder_with_cache(df, tmp_cache_path=None, store=None, new_cache_rows=None):
+    """Fill lat/lng from the geocoding cache, resolving misses via the Geocoding API."""
     print("[INFO] Geocoding with cache...")
     if df.empty: return df
     
@@ -263,66 +795,92 @@ def run_geocoder_with_cache(df, tmp_cache_path=None):
     if not tmp_cache_path:
         tmp_cache_path = os.path.join(tempfile.gettempdir(), f"cache_{os.getpid()}.parquet")
 
-    def make_full_address(row):
-        addr = str(row.get('地址', ''))
-        city = str(row.get('縣市', ''))
-        dist = str(row.get('行政區', ''))
-        
-        full = addr
-        # 補回行政區 (若地址開頭沒有)
-        if dist and not full.startswith(dist):
-            full = dist + full
-        # 補回縣市 (若地址開頭沒有)
-        if city and not full.startswith(city):
-            full = city + full
-        return full
-
-    df['full_address_key'] = df.apply(make_full_address, axis=1)
+    # 標準化地址 (補回縣市/行政區，不含樓層與村里) 同時作為快取鍵與 Geocoding 查詢字串
+    df['full_address_key'] = _address_keys(df)
 
     # Setup GCS for cache
-    cache_df = pd.DataFrame(columns=['full_address_key', 'lat', 'lng'])
-    client_storage = storage.Client()
-    bucket = client_storage.bucket(BUCKET_NAME)
-    blob = bucket.blob(CACHE_BLOB_NAME)
-
-    if blob.exists():
-        try:
-            cache_df = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
-        except Exception:
-            pass
-
-    cache_df.drop_duplicates(subset=['full_address_key'], inplace=True)
-    df = pd.merge(df, cache_df, on='full_address_key', how='left')
+    bucket = None
+    if store is None:
+        bucket = get_gcs_bucket()
+        store = get_geocoding_store(bucket)
+
+    # 只查詢這批資料用到的地址
+    cached = store.get_many(df['full_address_key'].unique().tolist())
+    df['lat'] = df['full_address_key'].map({k: v[0] for k, v in cached.items()}).astype(float)
+    df['lng'] = df['full_address_key'].map({k: v[1] for k, v in cached.items()}).astype(float)
     
     mask_missing = df['lat'].isna() | df['lng'].isna()
 
     if mask_missing.sum() > 0 and GOOGLE_API_KEY:
-        gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
-        indices = df[mask_missing].index
-        new_cache_rows = []
-
-        print(f"[INFO] Resolving {len(indices)} addresses via API...")
-        for i, idx in enumerate(indices):
-            if (i + 1) % 10 == 0:
-                print(f"[INFO] Geocoding progress: {i+1}/{len(indices)}")
-            
-            addr = df.at[idx, 'full_address_key']
-            try:
-                res = gmaps.geocode(addr)
-                if res:
-                    loc = res[0]['geometry']['location']
-                    df.at[idx, 'lat'] = loc['lat']
-                    df.at[idx, 'lng'] = loc['lng']
-                    new_cache_rows.append({'full_address_key': addr, 'lat': loc['lat'], 'lng': loc['lng']})
-            except Exception:
-                pass
-            time.sleep(0.05)
-
-        if new_cache_rows:
-            _upload_geocoding_cache_safe(blob, new_cache_rows, tmp_cache_path)
+        upload = new_cache_rows is None
+        if upload: new_cache_rows = []
+
+        # 同一地址只查詢一次；先前失敗且尚未到重試時間的地址略過
+        missing = df.loc[mask_missing, 'full_address_key'].drop_duplicates().tolist()
+        now = time.time()
+        previous = store.get_failures(missing)
+        addresses = [k for k in missing if k not in previous or previous[k][2] <= now]
+        skipped = Counter("not_found" if previous[k][0] == "not_found" else "error"
+                          for k in missing if k in previous and previous[k][2] > now)
+
+        resolved, failed = geocode_addresses(addresses)
+        now = time.time()
+        if resolved:
+            for col, pos in (('lat', 0), ('lng', 1)):
+                values = df['full_address_key'].map({k: v[pos] for k, v in resolved.items()})
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(values)
+            new_cache_rows.extend({'full_address_key': k, 'lat': lat, 'lng': lng, 'updated_at': now}
+                                  for k, (lat, lng) in resolved.items())
+            store.put_many((k, lat, lng, now) for k, (lat, lng) in resolved.items())
+        if failed:
+            failures = []
+            for k, reason in failed.items():
+                attempts = previous[k][1] + 1 if k in previous else 1
+                failures.append((k, reason, attempts, now + geocode_retry_delay(reason, attempts), now))
+            new_cache_rows.extend({'full_address_key': k, 'lat': None, 'lng': None, 'updated_at': updated_at,
+                                   'reason': reason, 'attempts': attempts, 'next_eligible': next_eligible}
+                                  for k, reason, attempts, next_eligible, updated_at in failures)
+            store.put_failures(failures)
+
+        print(f"[INFO] Geocoding summary: {len(cached)} cached, {len(resolved)} resolved, {len(failed)} failed, "
+              f"{sum(skipped.values())} skipped in backoff "
+              f"(not found {skipped['not_found']}, errors {skipped['error']})")
+
+        if upload and new_cache_rows:
+            publish_geocoding_rows(store, bucket, new_cache_rows, tmp_cache_path)
 
     return df.drop(columns=['full_address_key'])
 
+_tag_memo = None
+_tag_memo_lock = threading.Lock()
+
+def get_tag_memo():
+    """Return the process-wide TagMemo, loaded from GCS (base + deltas) on first use."""
+    global _tag_memo
+    with _tag_memo_lock:
+        if _tag_memo is None:
+            _tag_memo = TagMemo(_SYNONYMS_HASH)
+            if BUCKET_NAME:
+                try:
+                    _tag_memo.merge(load_tag_memo_entries(get_gcs_bucket(), _SYNONYMS_HASH))
+                    print(f"[INFO] Loaded tag memo: {len(_tag_memo)} names")
+                except Exception as e:
+                    print(f"[WARN] Failed to load tag memo from GCS: {e}")
+        return _tag_memo
+
+def save_tag_memo():
+    """Append the names added since the last save as one delta object; nothing is read or rewritten."""
+    memo = _tag_memo
+    if memo is None or not memo.new or not BUCKET_NAME:
+        return False
+    new = memo.take_new()
+    if append_tag_memo_delta(get_gcs_bucket(), new, memo.synonyms_hash):
+        print(f"[INFO] Saved tag memo: {len(new)} new names")
+        return True
+    # 上傳失敗：留到下次再寫
+    memo.update(new)
+    return False
+
 def add_hidden_tags(df):
     if df.empty: return df
     
@@ -332,29 +890,88 @@ def add_hidden_tags(df):
     except ImportError:
         fuzz = None
 
-    def _find_tags(name):
-        if pd.isna(name) or not name: return ""
-        name_proc = str(name).lower()
-        tags = set()
-        for k, v in SYNONYMS_MAP.items():
-            v_proc = str(v).lower()
-            # Token matching
-            for token in v_proc.split():
-                if token in name_proc:
-                    tags.add(k)
-                    break
-            else:
-                # Fuzzy fallback
-                if fuzz and fuzz.partial_ratio(name_proc, v_proc) >= 80:
-                    tags.add(k)
-        return ",".join(sorted(tags))
-
-    df['hidden_tags'] = df['特店名稱'].apply(_find_tags)
+    names = df['特店名稱'].tolist()
+    valid = [i for i, name in enumerate(names) if not pd.isna(name) and name]
+    names_proc = [str(names[i]).lower() for i in valid]
+
+    # 重複出現的店名 (連鎖品牌) 直接查 memo，只計算新店名
+    memo = get_tag_memo()
+    known = memo.get_many(dict.fromkeys(names_proc))
+    pending = [name for name in dict.fromkeys(names_proc) if name not in known]
+
+    # Token matching: 一次掃描找出所有命中的品牌
+    tags = [_SYNONYM_MATCHER.find(name_proc) for name_proc in pending]
+    if fuzz:
+        # Fuzzy fallback: 整批以 cdist 多核心計算 (已被 token 命中的品牌結果不變)
+        for found, fuzzy in zip(tags, fuzzy_synonym_tags(pending, SYNONYMS_MAP, score_cutoff=80, workers=-1)):
+            found |= fuzzy
+    computed = {name: ",".join(sorted(found)) for name, found in zip(pending, tags)}
+    if fuzz:
+        # 沒有 rapidfuzz 時的結果不完整，不寫入 memo
+        memo.update(computed)
+    known.update(computed)
+
+    hidden_tags = [""] * len(names)
+    for i, name_proc in zip(valid, names_proc):
+        hidden_tags[i] = known[name_proc]
+    df['hidden_tags'] = hidden_tags
     return df
 
+def run_stream_stages(batches, tmp_cache_path=None):
+    """Run clean -> geocode -> tag over an iterable of scraped DataFrames as they arrive."""
+    bucket = get_gcs_bucket()
+    if not tmp_cache_path:
+        tmp_cache_path = os.path.join(tempfile.gettempdir(), f"cache_{os.getpid()}.parquet")
+
+    store = None
+    seen_keys = set()
+    new_cache_rows = []
+    processed = []
+    try:
+        for df_batch in batches:
+            df_batch = run_cleaner(df_batch, seen_keys=seen_keys)
+            if df_batch.empty: continue
+            if store is None:
+                store = get_geocoding_store(bucket)
+
+            df_batch = run_geocoder_with_cache(df_batch, tmp_cache_path=tmp_cache_path,
+                                               store=store, new_cache_rows=new_cache_rows)
+
+            processed.append(add_hidden_tags(df_batch))
+            print(f"[INFO] Stream batch done: {len(df_batch)} rows ({sum(len(d) for d in processed)} total)")
+    finally:
+        # 即使串流中斷，已解析的座標仍寫回快取
+        if new_cache_rows:
+            publish_geocoding_rows(store, bucket, new_cache_rows, tmp_cache_path)
+        save_tag_memo()
+
+    if not processed:
+        return pd.DataFrame()
+    return pd.concat(processed, ignore_index=True)
+
 # ================= 3. Gemini AI 處理模組 =================
 
-def get_prompt_content(ind_code, csv_text):
+# 輸出格式說明 (規則 1-4)，其餘規則兩種格式共用
+_CSV_OUTPUT_RULES = """請將輸入資料整理、**去重**並擴充為 CSV 格式，包含以下欄位(請保持順序)：
+ID|店名|縣市|行政區|地址(不含樓層)|樓層|緯度|經度|電話|評論|星級數|價格區間
+
+**重要規則：**
+1. **使用直線符號 `|` 作為分隔符號 (不要用逗號)。**
+2. **直接輸出 CSV 內容，不要有任何開頭語或結尾語。**
+3. **不要使用 Markdown 代碼區塊 (不要 ```csv ... ```)。**
+4. 第一行必須是標題列。"""
+
+_JSON_OUTPUT_RULES = """請將輸入資料整理、**去重**並擴充為 JSON 陣列，每家店一個物件，包含以下欄位：
+id(ID)|name(店名)|city(縣市)|district(行政區)|address(地址，不含樓層)|floor(樓層)|lat(緯度)|lng(經度)|phone(電話)|review_summary(評論)|rating(星級數)|price_level(價格區間)
+
+**重要規則：**
+1. **依指定的 JSON schema 輸出，每家店一個物件。**
+2. **直接輸出 JSON 內容，不要有任何開頭語或結尾語。**
+3. **不要使用 Markdown 代碼區塊。**
+4. 緯度、經度為數值，其餘欄位皆為字串；查無資料的欄位填 null。"""
+
+def get_prompt_instructions(ind_code, output_mode="csv"):
+    """The static part of the enrichment prompt (rules and industry instructions), without the input rows."""
     if ind_code == "0009": # 旅宿業
         instructions = """
 11. 星級數請註明滿星是幾星 (例: 4.5/5)。
@@ -374,15 +991,9 @@ def get_prompt_content(ind_code, csv_text):
 13. 評論請搜尋網路資料，寫一篇 80-100 字的店家特色摘要。
         """
 
+    output_rules = _JSON_OUTPUT_RULES if output_mode == "json" else _CSV_OUTPUT_RULES
     return f"""
-請將輸入資料整理、**去重**並擴充為 CSV 格式，包含以下欄位(請保持順序)：
-ID|店名|縣市|行政區|地址(不含樓層)|樓層|緯度|經度|電話|評論|星級數|價格區間
-
-**重要規則：**
-1. **使用直線符號 `|` 作為分隔符號 (不要用逗號)。**
-2. **直接輸出 CSV 內容，不要有任何開頭語或結尾語。**
-3. **不要使用 Markdown 代碼區塊 (不要 ```csv ... ```)。**
-4. 第一行必須是標題列。
+{output_rules}
 5. ID 請對應輸入資料的 temp_id。
 6. 地址要修正，確保縣市、地區、路名都有資訊且正確 (使用 Google Search)。
 7. 電話格式統一，前2碼加括號，其餘連接號捨棄。
@@ -391,77 +1002,590 @@ ID|店名|縣市|行政區|地址(不含樓層)|樓層|緯度|經度|電話|評
 10. **若網路上查無確切資訊，該欄位請直接留空。**
 14. **若輸入資料中有重複的店家，請自動合併。**
 {instructions}
-
-# 輸入資料
-{csv_text}
 """
 
-def run_gemini_processor(df, city_code, zip_code, ind_code):
+def _prompt_data(csv_text):
+    return f"# 輸入資料\n{csv_text}\n"
+
+def get_prompt_content(ind_code, csv_text, output_mode="csv"):
+    return f"{get_prompt_instructions(ind_code, output_mode)}\n{_prompt_data(csv_text)}"
+
+def _temp_id(city_code, zip_code, ind_code, index):
+    return f"{city_code}_{zip_code}_{ind_code}_{index:05d}"
+
+_GEMINI_INPUT_COLUMNS = ['縣市', '行政區', '特店名稱', '行業別', '電話', '地址', 'lat', 'lng', 'hidden_tags']
+
+def _prompt_version(ind_code):
+    """Hash of what shapes the output besides the rows: instructions, response schema, effective output mode."""
+    output_mode = _gemini_output_mode(get_gemini_client())
+    schema = _GEMINI_RESPONSE_SCHEMA.model_dump_json(exclude_none=True) if output_mode == "json" else ""
+    text = "\x1f".join([output_mode, get_prompt_instructions(ind_code, output_mode), schema])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+def gemini_row_keys(df, ind_code):
+    """Cache key per row: hash of its Gemini input columns, the prompt version of `ind_code` and the model."""
+    prefix = f"{GEMINI_MODEL_NAME}\x1f{_prompt_version(ind_code)}"
+    columns = [df[col].tolist() if col in df.columns else [None] * len(df) for col in _GEMINI_INPUT_COLUMNS]
+    return [hashlib.sha1("\x1f".join([prefix] + ["" if pd.isna(v) else str(v) for v in row]).encode("utf-8")).hexdigest()
+            for row in zip(*columns)]
+
+def _gemini_cache_paths(file_suffix):
+    filename = f"gemini_{file_suffix}.parquet"
+    return os.path.join(tempfile.gettempdir(), GEMINI_CACHE_DIR, filename), f"{GEMINI_CACHE_DIR}/{filename}"
+
+def load_gemini_cache(file_suffix):
+    """Load a cell's cached Gemini rows as {row key: (record json, updated_at)}, dropping expired entries."""
+    local_path, blob_name = _gemini_cache_paths(file_suffix)
+    df = None
+    if BUCKET_NAME:
+        try:
+            blob = get_gcs_bucket().blob(blob_name)
+            if blob.exists():
+                df = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+        except Exception as e:
+            print(f"[WARN] Failed to load Gemini cache from GCS: {e}")
+    if df is None and os.path.exists(local_path):
+        try:
+            df = pd.read_parquet(local_path)
+        except Exception:
+            df = None
+    if df is None or df.empty:
+        return {}
+    cutoff = time.time() - GEMINI_CACHE_TTL_DAYS * 86400
+    df = df[df['updated_at'] >= cutoff]
+    return {key: (record, updated_at) for key, record, updated_at in zip(df['key'], df['record'], df['updated_at'])}
+
+def save_gemini_cache(entries, file_suffix):
+    local_path, blob_name = _gemini_cache_paths(file_suffix)
+    df = pd.DataFrame([(key, record, updated_at) for key, (record, updated_at) in entries.items()],
+                      columns=['key', 'record', 'updated_at'])
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    atomic_write_parquet(local_path, df)
+    if BUCKET_NAME:
+        try:
+            get_gcs_bucket().blob(blob_name).upload_from_filename(local_path)
+        except Exception as e:
+            print(f"[WARN] Failed to save Gemini cache to GCS: {e}")
+
+# Gemini 輸出欄位 (CSV 欄位順序，亦為 JSON 物件的鍵)
+GEMINI_OUTPUT_FIELDS = ['id', 'name', 'city', 'district', 'address', 'floor', 'lat', 'lng', 'phone', 'review_summary', 'rating', 'price_level']
+
+_GEMINI_RESPONSE_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={field: types.Schema(type=types.Type.NUMBER if field in ('lat', 'lng') else types.Type.STRING,
+                                        nullable=True)
+                    for field in GEMINI_OUTPUT_FIELDS},
+        required=['id'],
+        property_ordering=GEMINI_OUTPUT_FIELDS,
+    ),
+)
+
+def _json_records(text, truncated=False):
+    """Objects of the JSON array in `text` (the complete ones if `truncated`)."""
+    content = (text or "").strip()
+    start = content.find('[')
+    if start < 0:
+        raise ValueError("no JSON array in response")
+    decoder = json.JSONDecoder()
+    records = []
+    pos = start + 1
+    while True:
+        while pos < len(content) and content[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(content) and content[pos] == ']':
+            return records
+        if pos >= len(content):
+            break
+        try:
+            record, pos = decoder.raw_decode(content, pos)
+        except json.JSONDecodeError:
+            break
+        if isinstance(record, dict):
+            records.append(record)
+    if not truncated:
+        raise ValueError("incomplete JSON array in response")
+    return records
+
+def _parse_gemini_response(text, chunk, output_mode="csv", truncated=False):
+    """Parse Gemini's answer for one chunk (pipe-separated CSV or a JSON array) and restore its hidden_tags."""
+    if output_mode == "json":
+        df_chunk_res = pd.DataFrame(_json_records(text, truncated), columns=GEMINI_OUTPUT_FIELDS)
+    else:
+        df_chunk_res = _parse_gemini_csv(text)
+        if truncated:
+            df_chunk_res = df_chunk_res.iloc[:-1]
+
+    # 補回 hidden_tags (從 chunk 對應)
+    if not df_chunk_res.empty and 'hidden_tags' in chunk.columns:
+        df_chunk_res['hidden_tags'] = df_chunk_res['id'].astype(str).map(chunk.set_index('temp_id')['hidden_tags'])
+    return df_chunk_res
+
+def _parse_gemini_csv(text):
+    content = text or ""
+    # 清理 Markdown
+    content = content.replace("```csv", "").replace("```", "").strip()
+
+    # 尋找 CSV 起始點
+    match = re.search(r'(ID\s*\|.*)', content, re.DOTALL)
+    if match:
+        content = match.group(1)
+
+    return pd.read_csv(io.StringIO(content),
+                       names=GEMINI_OUTPUT_FIELDS,
+                       header=0,
+                       sep='|')
+
+def _is_truncated(response):
+    """True if the response stopped at the output token limit (finish_reason MAX_TOKENS)."""
+    for candidate in getattr(response, 'candidates', None) or []:
+        reason = getattr(candidate, 'finish_reason', None)
+        if getattr(reason, 'name', reason) == 'MAX_TOKENS':
+            return True
+    return False
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client():
+    """Process-wide GeminiClient: the one set with set_gemini_client, else the SDK client (None without an API key)."""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None and client:
+            _gemini_client = GenAIClient(client, GEMINI_MODEL_NAME)
+        return _gemini_client
+
+def set_gemini_client(gemini_client):
+    """Use another GeminiClient (e.g. a local stub) for enrichment; None goes back to the SDK client."""
+    global _gemini_client, _context_caches
+    with _gemini_client_lock:
+        _gemini_client = gemini_client
+        # cache 屬於原本的 client，不再沿用
+        _context_caches = ContextCacheRegistry(ttl=GEMINI_CONTEXT_CACHE_TTL, margin=GEMINI_CONTEXT_CACHE_MARGIN)
+
+# 每個行業的靜態指令只註冊一次 context cache (由 Gemini 事件迴圈使用)
+_context_caches = ContextCacheRegistry(ttl=GEMINI_CONTEXT_CACHE_TTL, margin=GEMINI_CONTEXT_CACHE_MARGIN)
+
+# 不接受 response schema 的模型 (執行期間偵測到後改用 CSV 輸出)
+_schema_unsupported_models = set()
+
+def _gemini_output_mode(gemini):
+    if GEMINI_OUTPUT_MODE == "json" and (gemini is None or gemini.model not in _schema_unsupported_models):
+        return "json"
+    return "csv"
+
+def _schema_unsupported(error):
+    """True if the API rejected a request because the model cannot use a response schema (with its tools)."""
+    message = str(error).lower()
+    return getattr(error, 'code', None) == 400 and any(
+        hint in message for hint in ('response_schema', 'response schema', 'response_mime_type',
+                                     'response mime type', 'json mode', 'controlled generation'))
+
+# 每次回應的 token 用量 (usage_metadata)，run_gemini_processor 結束時輸出本次的差額
+_gemini_usage = Counter()
+
+def _record_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    _gemini_usage['requests'] += 1
+    _gemini_usage['prompt_tokens'] += getattr(usage, 'prompt_token_count', None) or 0
+    _gemini_usage['cached_tokens'] += getattr(usage, 'cached_content_token_count', None) or 0
+
+async def _send_chunk(gemini, chunk, ind_code, output_mode, semaphore):
+    """One request for a chunk; the static instructions are sent as GEMINI_PROMPT_MODE says."""
+    schema = _GEMINI_RESPONSE_SCHEMA if output_mode == "json" else None
+    csv_text = chunk[['temp_id'] + _GEMINI_INPUT_COLUMNS].to_csv(index=False)
+    if GEMINI_PROMPT_MODE == "inline":
+        async with semaphore:
+            return await gemini.generate(get_prompt_content(ind_code, csv_text, output_mode), response_schema=schema)
+
+    instructions = get_prompt_instructions(ind_code, output_mode)
+    cache_name = None
+    if GEMINI_PROMPT_MODE == "cache":
+        cache_name = await _context_caches.get(gemini, instructions, display_name=f"enrich-{ind_code}-{output_mode}")
+    async with semaphore:
+        try:
+            if cache_name:
+                return await gemini.generate(_prompt_data(csv_text), cached_content=cache_name, response_schema=schema)
+            return await gemini.generate(_prompt_data(csv_text), system_instruction=instructions, response_schema=schema)
+        except Exception as e:
+            # cache 提前失效 (過期或被刪除) 時下次重試會重新建立
+            if cache_name and 'cache' in str(e).lower():
+                _context_caches.invalidate(cache_name)
+            raise
+
+async def _generate_chunk(chunk, ind_code, semaphore):
+    """Send one request for a chunk in the current output mode; returns (response, output_mode)."""
+    gemini = get_gemini_client()
+    output_mode = _gemini_output_mode(gemini)
+    try:
+        response = await _send_chunk(gemini, chunk, ind_code, output_mode, semaphore)
+    except Exception as e:
+        if output_mode != "json" or not _schema_unsupported(e):
+            raise
+        _schema_unsupported_models.add(gemini.model)
+        print(f"[WARN] {gemini.model} does not accept a response schema, falling back to CSV output: {e}")
+        output_mode = "csv"
+        response = await _send_chunk(gemini, chunk, ind_code, output_mode, semaphore)
+    _record_usage(response)
+    return response, output_mode
+
+async def _process_gemini_chunk(chunk, ind_code, semaphore, sizer):
+    """Send one chunk (rows with a temp_id column) and return its records, bisecting it on content failures."""
+    label = f"{chunk.index[0]}-{chunk.index[-1]}" if len(chunk) > 1 else f"{chunk.index[0]}"
+    df_chunk_res = pd.DataFrame()
+    truncated = False
+    content_error = False
+    for attempt in range(GEMINI_MAX_RETRIES):
+        try:
+            response, output_mode = await _generate_chunk(chunk, ind_code, semaphore)
+        except Exception as e:
+            print(f"[ERROR] Batch {label} Attempt {attempt+1} Error: {e}")
+            if getattr(e, 'code', None) == 400:
+                # 請求內容被拒，重送同一批沒有用
+                content_error = True
+                break
+            # 429 / 5xx / 逾時：切分無法找出問題列，整批退避重試
+            await asyncio.sleep(2 * 2 ** attempt)
+            continue
+
+        truncated = _is_truncated(response)
+        sizer.record(len(chunk), truncated)
+        try:
+            df_chunk_res = _parse_gemini_response(response.text, chunk, output_mode, truncated)
+        except Exception as e:
+            print(f"[WARN] Batch {label} Attempt {attempt+1}: Unparseable {output_mode.upper()} ({e})")
+            df_chunk_res = pd.DataFrame()
+        else:
+            if not df_chunk_res.empty:
+                break
+            print(f"[WARN] Batch {label} Attempt {attempt+1}: Empty {output_mode.upper()} returned.")
+        content_error = True
+        if len(chunk) > 1:
+            break
+        await asyncio.sleep(2) # Retry delay
+
+    if df_chunk_res.empty:
+        if len(chunk) == 1 or not content_error:
+            print(f"[ERROR] Batch {label} failed after {attempt+1} attempts, {len(chunk)} rows dropped.")
+            return []
+        # 切半分別重送，直到找出無法處理的列
+        mid = len(chunk) // 2
+        print(f"[INFO] Batch {label}: splitting into {mid} + {len(chunk) - mid} rows")
+        halves = await asyncio.gather(_process_gemini_chunk(chunk.iloc[:mid], ind_code, semaphore, sizer),
+                                      _process_gemini_chunk(chunk.iloc[mid:], ind_code, semaphore, sizer))
+        return halves[0] + halves[1]
+    records = df_chunk_res.to_dict('records')
+    print(f"[SUCCESS] Batch {label} processed {len(records)} records.")
+    if truncated:
+        missing = chunk[~chunk['temp_id'].isin(df_chunk_res['id'].astype(str))]
+        if not missing.empty and len(missing) < len(chunk):
+            print(f"[INFO] Batch {label}: output truncated, resending {len(missing)} rows")
+            records += await _process_gemini_chunk(missing, ind_code, semaphore, sizer)
+    return records
+
+async def _run_gemini_rows(df, ind_code, concurrency, sizer):
+    """Split `df` into chunks and process them with at most `concurrency` requests in flight."""
+    csv_text = df[['temp_id'] + _GEMINI_INPUT_COLUMNS].to_csv(index=False)
+    tokens_per_char = 1.0
+    try:
+        total_tokens = await get_gemini_client().count_tokens(csv_text)
+        if total_tokens:
+            tokens_per_char = total_tokens / len(csv_text)
+    except Exception as e:
+        print(f"[WARN] Gemini token count failed, assuming 1 token per character: {e}")
+    row_chars = df[['temp_id'] + _GEMINI_INPUT_COLUMNS].astype(str).apply(lambda col: col.str.len()).sum(axis=1)
+    row_tokens = ((row_chars + len(_GEMINI_INPUT_COLUMNS) + 1) * tokens_per_char).tolist()
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    slots = asyncio.Semaphore(max(1, concurrency))
+    tasks = []
+    start = 0
+    while start < len(df):
+        await slots.acquire()
+        end = next_chunk_end(row_tokens, start, GEMINI_CHUNK_TOKENS, sizer.max_rows)
+        task = asyncio.ensure_future(_process_gemini_chunk(df.iloc[start:end], ind_code, semaphore, sizer))
+        task.add_done_callback(lambda _: slots.release())
+        tasks.append(task)
+        start = end
+    return await asyncio.gather(*tasks)
+
+_chunk_sizer = None
+_chunk_sizer_lock = threading.Lock()
+
+def get_chunk_sizer():
+    """Process-wide AdaptiveChunkSizer, so the row limit learned in one cell carries over to the next."""
+    global _chunk_sizer
+    with _chunk_sizer_lock:
+        if _chunk_sizer is None:
+            _chunk_sizer = AdaptiveChunkSizer(max_rows=GEMINI_CHUNK_SIZE, ceiling=GEMINI_MAX_CHUNK_SIZE)
+        return _chunk_sizer
+
+_gemini_loop = None
+_gemini_loop_lock = threading.Lock()
+
+def _get_gemini_loop():
+    """Process-wide event loop on a daemon thread, so the async genai client always runs on the same loop."""
+    global _gemini_loop
+    with _gemini_loop_lock:
+        if _gemini_loop is None:
+            _gemini_loop = asyncio.new_event_loop()
+            threading.Thread(target=_gemini_loop.run_forever, name="gemini-aio", daemon=True).start()
+        return _gemini_loop
+
+def run_gemini_processor(df, city_code, zip_code, ind_code, concurrency=None, use_cache=None):
+    """Enrich `df` with Gemini in chunks, reusing cached rows; returns the result records."""
     df = df.reset_index(drop=True)
-    CHUNK_SIZE = 30
-    results = []
     total_records = len(df)
+    concurrency = concurrency or GEMINI_CONCURRENCY
+    use_cache = GEMINI_CACHE if use_cache is None else use_cache
     
-    print(f"[INFO] AI Processing: {total_records} records.")
+    print(f"[INFO] AI Processing: {total_records} records. [concurrency={concurrency}]")
 
-    if not client:
-        print("[ERROR] Gemini Client not initialized.")
-        return []
+    file_suffix = f"{city_code}_{zip_code}_{ind_code}"
+    keys = gemini_row_keys(df, ind_code) if use_cache else []
+    cache = load_gemini_cache(file_suffix) if use_cache else {}
+    results = []
+    for i, key in enumerate(keys):
+        if key in cache:
+            record = json.loads(cache[key][0])
+            record['id'] = _temp_id(city_code, zip_code, ind_code, i)
+            results.append(record)
+    pending = df.drop(index=[i for i, key in enumerate(keys) if key in cache])
+    if use_cache:
+        print(f"[INFO] Gemini cache: {len(results)} rows cached, {len(pending)} rows to send")
+
+    if not pending.empty and get_gemini_client() is None:
+        # 已快取的結果照常回傳，只略過需要送出的列
+        print(f"[ERROR] Gemini Client not initialized, skipping {len(pending)} uncached rows.")
+    elif not pending.empty:
+        # 未快取的列重新組成 chunk (temp_id 取自原索引，不因快取而改變)
+        pending = pending.copy()
+        pending['temp_id'] = pending.index.map(lambda x: _temp_id(city_code, zip_code, ind_code, x))
+        sizer = get_chunk_sizer()
+        usage_before = Counter(_gemini_usage)
+        future = asyncio.run_coroutine_threadsafe(_run_gemini_rows(pending, ind_code, concurrency, sizer),
+                                                  _get_gemini_loop())
+        fresh = [record for records in future.result() for record in records]
+        results.extend(fresh)
+        print(f"[INFO] Gemini chunks: limit {sizer.max_rows} rows, "
+              f"truncation rate {sizer.truncation_rate:.1%} ({sizer.truncated}/{sizer.responses} responses)")
+        usage = _gemini_usage - usage_before
+        if usage['requests']:
+            print(f"[INFO] Gemini input: {usage['prompt_tokens'] / usage['requests']:.0f} prompt tokens per request "
+                  f"({usage['cached_tokens'] / usage['requests']:.0f} from context cache, prompt mode {GEMINI_PROMPT_MODE})")
+
+        if use_cache and fresh:
+            # 執行中改用 CSV 輸出時，結果要記在新的 key 下
+            keys = gemini_row_keys(df, ind_code)
+            index_of = {_temp_id(city_code, zip_code, ind_code, i): i for i in pending.index}
+            now = time.time()
+            for record in fresh:
+                i = index_of.get(str(record.get('id')))
+                if i is not None:
+                    cache[keys[i]] = (json.dumps({k: v for k, v in record.items() if k != 'id'}, ensure_ascii=False), now)
+            save_gemini_cache(cache, file_suffix)
+
+    return sorted(results, key=lambda record: str(record.get('id')))
+
+_DISTRICT_ZIPS = {name: code for code, name in ZIP_CODES.items()}
+
+def in_district_bounds(lat, lng, district):
+    """True if (lat, lng) lies inside the DISTRICT_BOUNDS box of a district name."""
+    bounds = DISTRICT_BOUNDS.get(_DISTRICT_ZIPS.get(district))
+    return bool(bounds) and bounds[0] <= lat <= bounds[1] and bounds[2] <= lng <= bounds[3]
+
+def backfill_geocoding_from_gemini(df, results, city_code, zip_code, ind_code):
+    """Write Gemini coordinates for rows the Geocoding API left unresolved into the geocoding cache."""
+    df = df.reset_index(drop=True)
+    if df.empty or not results or 'lat' not in df.columns:
+        return 0
+    original_keys = _address_keys(df)
+    unresolved = {_temp_id(city_code, zip_code, ind_code, i): i
+                  for i in df.index[pd.to_numeric(df['lat'], errors='coerce').isna()]}
+
+    rows = {}
+    rejected = 0
+    now = time.time()
+    for rec in results:
+        i = unresolved.get(str(rec.get('id')))
+        lat = pd.to_numeric(rec.get('lat'), errors='coerce')
+        lng = pd.to_numeric(rec.get('lng'), errors='coerce')
+        if i is None or pd.isna(lat) or pd.isna(lng):
+            continue
+        # Gemini 留空的縣市/行政區以爬蟲資料補上
+        city = rec.get('city') if isinstance(rec.get('city'), str) and rec.get('city') else df.at[i, '縣市']
+        district = rec.get('district') if isinstance(rec.get('district'), str) and rec.get('district') else df.at[i, '行政區']
+        parsed = parse_address(rec.get('address'), city, district)
+        key = canonical_address(rec.get('address'), city, district)
+        if not parsed.number or not in_district_bounds(lat, lng, parsed.district):
+            rejected += 1
+            continue
+        confidence = "high" if key == original_keys[i] else "low"
+        rows[key] = (key, float(lat), float(lng), now, "gemini", confidence)
+
+    if rows:
+        store = get_geocoding_store()
+        store.put_many(rows.values())
+        publish_geocoding_rows(store, get_gcs_bucket(), [
+            {'full_address_key': key, 'lat': lat, 'lng': lng, 'updated_at': updated_at,
+             'source': source, 'confidence': confidence}
+            for key, lat, lng, updated_at, source, confidence in rows.values()])
+    print(f"[INFO] Gemini geocoding backfill: {len(rows)} entries written, {rejected} rejected "
+          f"({len(unresolved)} rows unresolved by the Geocoding API)")
+    return len(rows)
+
+# ================= Fragment 輔助函數 =================
+
+def upload_fragment(final_file_path, file_suffix):
+    """Upload a final_*.parquet fragment to GCS for the merge job; returns its generation (False on failure)."""
+    if not BUCKET_NAME:
+        return False
+    try:
+        blob_name = f"{FRAGMENTS_DIR}/final_{file_suffix}.parquet"
+        blob = get_gcs_bucket().blob(blob_name)
+        blob.upload_from_filename(final_file_path)
+        print(f"[UPLOAD] Fragment uploaded to gs://{BUCKET_NAME}/{blob_name}")
+        return blob.generation or True
+    except Exception as e:
+        print(f"[ERROR] Failed to upload fragment: {e}")
+        return False
 
-    for i in range(0, total_records, CHUNK_SIZE):
-        chunk = df.iloc[i: i + CHUNK_SIZE].copy()
-        if chunk.empty: continue
+def merchant_keys(df):
+    """Merchant identity per scraped row: phone digits + canonical address with floor (the run_cleaner dedup key)."""
+    phones = df['電話'].fillna("").astype(str) if '電話' in df.columns else pd.Series("", index=df.index)
+    digits = _digits_only(phones.astype(_ARROW_STRING)).astype(object)
+    return (digits + '_' + _address_keys(df, with_floor=True)).tolist()
 
-        chunk['temp_id'] = chunk.index.map(lambda x: f"{city_code}_{zip_code}_{ind_code}_{x:05d}")
-        csv_text = chunk[['temp_id', '縣市', '行政區', '特店名稱', '行業別', '電話', '地址', 'lat', 'lng', 'hidden_tags']].to_csv(index=False)
-        prompt_content = get_prompt_content(ind_code, csv_text)
+def _enrich_state_blob_name(file_suffix):
+    return f"{ENRICH_STATE_DIR}/keys_{file_suffix}.parquet"
 
-        MAX_RETRIES = 3
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = client.models.generate_content(
-                    model=GEMINI_MODEL_NAME,
-                    contents=prompt_content,
-                    config=types.GenerateContentConfig(
-                        tools=[types.Tool(google_search=types.GoogleSearch())]
-                    )
-                )
-                
-                content = response.text or ""
-                # 清理 Markdown
-                content = content.replace("```csv", "").replace("```", "").strip()
-                
-                # 尋找 CSV 起始點
-                match = re.search(r'(ID\s*\|.*)', content, re.DOTALL)
-                if match:
-                    content = match.group(1)
-
-                df_chunk_res = pd.read_csv(io.StringIO(content),
-                                         names=['id', 'name', 'city', 'district', 'address', 'floor', 'lat', 'lng', 'phone', 'review_summary', 'rating', 'price_level'],
-                                         header=0,
-                                         sep='|')
-
-                if not df_chunk_res.empty:
-                    print(f"[SUCCESS] Batch {i} processed {len(df_chunk_res)} records.")
-                    
-                    # 補回 hidden_tags (從 chunk 對應)
-                    if 'hidden_tags' in chunk.columns:
-                        df_chunk_res['hidden_tags'] = df_chunk_res['id'].map(chunk.set_index('temp_id')['hidden_tags'])
+def load_enrichment_state(file_suffix):
+    """Previous fragment of a cell with each row's src_key and src_hash; empty if the fragment changed since."""
+    if not BUCKET_NAME:
+        return pd.DataFrame()
+    try:
+        bucket = get_gcs_bucket()
+        fragment_blob = bucket.get_blob(f"{FRAGMENTS_DIR}/final_{file_suffix}.parquet")
+        state_blob = bucket.get_blob(_enrich_state_blob_name(file_suffix))
+        if fragment_blob is None or state_blob is None:
+            return pd.DataFrame()
+        state = pd.read_parquet(io.BytesIO(state_blob.download_as_bytes()))
+        if state.empty or (state['fragment_generation'] != fragment_blob.generation).any():
+            print("[INFO] Enrichment state does not match the current fragment, enriching the whole cell")
+            return pd.DataFrame()
+        previous_df = pd.read_parquet(io.BytesIO(fragment_blob.download_as_bytes()))
+    except Exception as e:
+        print(f"[WARN] Failed to load enrichment state: {e}")
+        return pd.DataFrame()
+    previous_df['id'] = previous_df['id'].astype(str)
+    return previous_df.merge(state[['id', 'src_key', 'src_hash']], on='id', how='inner')
+
+def save_enrichment_state(state, file_suffix, fragment_generation):
+    """Save the (id, src_key, src_hash) rows of a fragment just uploaded with `fragment_generation`."""
+    if not BUCKET_NAME or state is None:
+        return
+    buf = io.BytesIO()
+    state.assign(fragment_generation=int(fragment_generation)).to_parquet(buf, index=False)
+    try:
+        get_gcs_bucket().blob(_enrich_state_blob_name(file_suffix)).upload_from_string(
+            buf.getvalue(), content_type="application/octet-stream")
+    except Exception as e:
+        print(f"[WARN] Failed to save enrichment state: {e}")
 
-                    results.extend(df_chunk_res.to_dict('records'))
-                    break
-                else:
-                    print(f"[WARN] Batch {i} Attempt {attempt+1}: Empty CSV returned.")
-            
-            except Exception as e:
-                print(f"[ERROR] Batch {i} Attempt {attempt+1} Error: {e}")
-                time.sleep(2)
-            
-            time.sleep(2) # Retry delay
-        
-        time.sleep(2) # Chunk delay
+def _format_final_frame(final_df, ind_name):
+    """Type, fill and order the columns of an enriched cell for its final fragment."""
+    # 資料型別轉換和格式化
+    for col in ['id', 'phone', 'name']:
+        if col in final_df.columns:
+            final_df[col] = final_df[col].astype(str)
+
+    final_df['ind'] = ind_name
+
+    for col in ['lat', 'lng']:
+        if col in final_df.columns:
+            final_df[col] = pd.to_numeric(final_df[col], errors='coerce')
+
+    # 填充 NaN 值
+    str_cols = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'phone', 'review_summary', 'rating', 'price_level', 'hidden_tags']
+    for col in str_cols:
+        if col in final_df.columns:
+            final_df[col] = final_df[col].fillna("").astype(str)
 
-    return results
+    # 重新排列欄位
+    target_order = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'lat', 'lng', 'phone', 'review_summary', 'rating', 'price_level']
+    if 'hidden_tags' in final_df.columns:
+        target_order.append('hidden_tags')
+
+    final_cols = [c for c in target_order if c in final_df.columns]
+    return final_df[final_cols]
+
+def enrich_cell(df, city_code, zip_code, ind_code, ind_name, incremental=False):
+    """Enrich a cell's cleaned rows with Gemini; returns (final_df, state)."""
+    df = df.reset_index(drop=True)
+    file_suffix = f"{city_code}_{zip_code}_{ind_code}"
+    pending = df
+    carried = stale = pd.DataFrame()
+    state = None
+    if incremental:
+        state = pd.DataFrame({'id': [_temp_id(city_code, zip_code, ind_code, i) for i in df.index],
+                              'src_key': merchant_keys(df), 'src_hash': gemini_row_keys(df, ind_code)})
+        previous = load_enrichment_state(file_suffix)
+        if not previous.empty:
+            previous = previous.drop_duplicates(subset=['src_key'], keep='last').set_index('src_key')
+            previous_hash = state['src_key'].map(previous['src_hash'])
+            known = previous_hash.notna()
+            unchanged = known & (previous_hash == state['src_hash'])
+
+            def previous_rows(mask):
+                rows = previous.loc[state.loc[mask, 'src_key']].reset_index(drop=True)
+                rows['id'] = state.loc[mask, 'id'].to_numpy()
+                return rows
+
+            carried, stale = previous_rows(unchanged), previous_rows(known & ~unchanged)
+            pending = df[~unchanged]
+            removed = int((~previous.index.isin(state['src_key'])).sum())
+            print(f"[INFO] Incremental enrichment: {len(carried)} unchanged, {len(stale)} changed, "
+                  f"{len(pending) - len(stale)} new, {removed} removed")
+        else:
+            print(f"[INFO] Incremental enrichment: no previous state, enriching all {len(df)} rows")
+
+    results = []
+    if not pending.empty:
+        # 送出的列重新編號，結果的 id 再對應回整個 cell 的索引
+        pending_df = pending.reset_index(drop=True)
+        results = run_gemini_processor(pending_df, city_code, zip_code, ind_code)
+        if GEMINI_GEOCODE_BACKFILL and results:
+            try:
+                backfill_geocoding_from_gemini(pending_df, results, city_code, zip_code, ind_code)
+            except Exception as e:
+                print(f"[WARN] Gemini geocoding backfill failed: {e}")
+        if incremental:
+            id_map = {_temp_id(city_code, zip_code, ind_code, j): _temp_id(city_code, zip_code, ind_code, i)
+                      for j, i in enumerate(pending.index)}
+            results = [{**record, 'id': id_map.get(str(record.get('id')), record.get('id'))} for record in results]
+
+    if incremental:
+        returned = {str(record.get('id')) for record in results}
+        sent = {_temp_id(city_code, zip_code, ind_code, i) for i in pending.index}
+        stale = stale[~stale['id'].isin(returned)] if not stale.empty else stale
+        # 沒有結果的新特店不記錄 (下次重送)；沿用舊列的變動特店記錄舊雜湊，下次仍視為變動
+        previous_hash = dict(zip(stale['id'], stale['src_hash'])) if not stale.empty else {}
+        state = state[~state['id'].isin(sent - returned - set(previous_hash))]
+        state = state.assign(src_hash=state['id'].map(previous_hash).fillna(state['src_hash']))
+        if previous_hash:
+            print(f"[WARN] {len(stale)} changed merchants got no Gemini result, keeping their previous rows")
+            stale = stale.drop(columns=['src_hash'])
+
+    frames = [frame for frame in (carried, stale, pd.DataFrame(results)) if not frame.empty]
+    if not frames:
+        return pd.DataFrame(), state
+    final_df = pd.concat(frames, ignore_index=True)
+    final_df['id'] = final_df['id'].astype(str)
+    final_df = final_df.sort_values('id', kind='stable').reset_index(drop=True)
+    return _format_final_frame(final_df, ind_name), state
 
 # ================= Main Execution =================
 
@@ -472,6 +1596,13 @@ def main():
     parser.add_argument("--industry", help="Industry codes separated by comma (e.g., 0009)")
     parser.add_argument("--output_dir", default="outputs", help="Directory to save partial results")
     parser.add_argument("--use_raw", action="store_true", help="Use existing raw parquet file")
+    parser.add_argument("--concurrency", type=int, default=None, help="Fixed concurrent page requests per cell (default: adaptive)")
+    parser.add_argument("--rps", type=float, default=None, help="Fixed max requests/sec to the NCCC host (default: adaptive)")
+    parser.add_argument("--cache_dir", default=None, help="Cache raw NCCC responses in this directory (default: SCRAPER_CACHE_DIR)")
+    parser.add_argument("--cache_ttl", type=int, default=None, help="Seconds a cached response stays fresh (default: SCRAPER_CACHE_TTL)")
+    parser.add_argument("--replay", action="store_true", help="Serve pages only from the response cache (no network)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only send new or changed merchants to Gemini, carrying the rest over from the previous fragment")
     args = parser.parse_args()
 
     if not GOOGLE_API_KEY:
@@ -481,6 +1612,8 @@ def main():
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
 
+    response_cache = make_response_cache(args.cache_dir, args.cache_ttl, replay=args.replay)
+
     target_cities = [args.city] if args.city else ["001"]
     target_zips = args.zip.split(",") if args.zip else list(ZIP_CODES.keys())
     target_industries = args.industry.split(",") if args.industry else ["0009"]
@@ -505,21 +1638,18 @@ def main():
                     print(f"[SKIP] {zip_name} - {ind_name} already exists.")
                     continue
 
-                # 1. Scrape
-                df_batch = run_scraper_batch(city_code, city_name, zip_code, zip_name, ind_code, ind_name)
-
-                if df_batch.empty:
-                    print(f"[INFO] No data for {zip_name} - {ind_name}.")
-                    continue
+                # 1. Scrape (串流：每批頁面抵達後立即進入下一階段)
+                batches = iter_scraper_batches(city_code, city_name, zip_code, zip_name, ind_code, ind_name,
+                                               concurrency=args.concurrency, rps=args.rps, cache=response_cache)
 
                 # 2. Clean & Geocode & Tag
-                df_batch = run_cleaner(df_batch)
-                
                 # 使用 City/Zip/Ind 作為 Cache 暫存檔名，避免平行衝突
                 cache_path = os.path.join(tempfile.gettempdir(), f"cache_{city_code}_{zip_code}_{ind_code}.parquet")
-                df_batch = run_geocoder_with_cache(df_batch, tmp_cache_path=cache_path)
+                df_batch = run_stream_stages(batches, tmp_cache_path=cache_path)
 
-                df_batch = add_hidden_tags(df_batch)
+                if df_batch.empty:
+                    print(f"[INFO] No data for {zip_name} - {ind_name}.")
+                    continue
 
                 # Save Raw
                 if not df_batch.empty:
@@ -539,53 +1669,61 @@ def main():
                     print("[INFO] No data for AI processing.")
                     continue
 
-                batch_results = run_gemini_processor(df_for_ai, city_code, zip_code, ind_code)
-
-                if batch_results:
-                    final_df = pd.DataFrame(batch_results)
-                    # Data Type Formatting
-                    for col in ['id', 'phone', 'name']:
-                        if col in final_df.columns: final_df[col] = final_df[col].astype(str)
-
-                    final_df['ind'] = ind_name
+                final_df, enrich_state = enrich_cell(df_for_ai, city_code, zip_code, ind_code, ind_name,
+                                                     incremental=args.incremental)
 
-                    for col in ['lat', 'lng']:
-                        if col in final_df.columns: final_df[col] = pd.to_numeric(final_df[col], errors='coerce')
-
-                    # Fill NaN for string columns only
-                    str_cols = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'phone', 'review_summary', 'rating', 'price_level', 'hidden_tags']
-                    for col in str_cols:
-                        if col in final_df.columns:
-                            final_df[col] = final_df[col].fillna("").astype(str)
-
-                    # Reorder columns as requested
-                    target_order = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'lat', 'lng', 'phone', 'review_summary', 'rating', 'price_level']
-                    if 'hidden_tags' in final_df.columns:
-                        target_order.append('hidden_tags')
-                    
-                    # Ensure we only select columns that exist
-                    final_cols = [c for c in target_order if c in final_df.columns]
-                    final_df = final_df[final_cols]
-                    
+                if not final_df.empty:
                     if atomic_write_parquet(final_file_path, final_df):
                         print(f"[INFO] Saved final records to {final_file_path}")
                         
                         # [NEW] 立即上傳 Fragment 到 GCS，作為合併前的暫存
-                        if BUCKET_NAME:
-                            try:
-                                blob_name = f"{FRAGMENTS_DIR}/final_{file_suffix}.parquet"
-                                client_storage = storage.Client()
-                                bucket = client_storage.bucket(BUCKET_NAME)
-                                blob = bucket.blob(blob_name)
-                                blob.upload_from_filename(final_file_path)
-                                print(f"[UPLOAD] Fragment uploaded to gs://{BUCKET_NAME}/{blob_name}")
-                            except Exception as e:
-                                print(f"[ERROR] Failed to upload fragment: {e}")
+                        generation = upload_fragment(final_file_path, file_suffix)
+                        if generation and enrich_state is not None:
+                            save_enrichment_state(enrich_state, file_suffix, generation)
                 else:
                     print("[INFO] No results from Gemini.")
 
     print("[INFO] Batch processing completed.")
 
+def _process_cell(batches, city, city_name, zip_code, zip_name, ind_code, ind_name, output_dir,
+                  use_raw=False, incremental=False):
+    """Clean, geocode, tag and enrich one cell and upload its fragment; True if written, None if no data."""
+    file_suffix = f"{city}_{zip_code}_{ind_code}"
+    raw_file_path = os.path.join(output_dir, f"raw_{file_suffix}.parquet")
+    final_file_path = os.path.join(output_dir, f"final_{file_suffix}.parquet")
+
+    # 2. Clean & Geocode & Tag (隨批次抵達逐批處理)
+    cache_path = os.path.join(tempfile.gettempdir(), f"cache_{city}_{zip_code}_{ind_code}.parquet")
+    df_batch = run_stream_stages(batches, tmp_cache_path=cache_path)
+    if df_batch.empty:
+        logger.info(f"[INFO] No data for {zip_name} - {ind_name}.")
+        return None
+
+    # Save Raw
+    if not df_batch.empty:
+        atomic_write_parquet(raw_file_path, df_batch)
+        logger.info(f"[INFO] Saved raw records to {raw_file_path}")
+
+    # 3. Gemini Processing
+    df_for_ai = df_batch if not use_raw else pd.read_parquet(raw_file_path)
+
+    if df_for_ai.empty:
+        logger.info("[INFO] No data for AI processing.")
+        return False
+
+    final_df, enrich_state = enrich_cell(df_for_ai, city, zip_code, ind_code, ind_name, incremental=incremental)
+    if final_df.empty:
+        logger.warning("[WARN] No results from Gemini.")
+        return False
+
+    if atomic_write_parquet(final_file_path, final_df):
+        logger.info(f"[SUCCESS] {city_name} - {zip_name} - {ind_name}: {len(final_df)} records")
+        generation = upload_fragment(final_file_path, file_suffix)
+        if generation and enrich_state is not None:
+            save_enrichment_state(enrich_state, file_suffix, generation)
+        return True
+    return False
+
 def run_pipeline_for_config(config):
     """
     適用於 Cloud Scheduler 的管線運行函數
@@ -597,7 +1735,15 @@ def run_pipeline_for_config(config):
             "industries": ["0009"],         # 行業代碼清單（必須）
             "districts": None,              # 特定行政區代碼清單（可選）
             "output_dir": "outputs",        # 輸出目錄（可選）
-            "use_raw": False                # 是否使用現有 raw 檔案（可選）
+            "use_raw": False,               # 是否使用現有 raw 檔案（可選）
+            "scrape_concurrency": None,     # 固定的在途頁面請求數（可選，未設定則自適應）
+            "scrape_rps": None,             # 固定的每秒請求上限（可選，未設定則自適應）
+            "cache_dir": None,              # HTTP 回應快取目錄（可選）
+            "cache_ttl": 86400,             # 快取有效秒數（可選）
+            "replay": False,                # 僅從快取重播（可選）
+            "delta": False,                 # 差異爬蟲：跳過未變動的 cell，其餘只將新增/變動的特店送往 Gemini（可選）
+            "incremental": False,           # 增量 enrichment：完整爬取，但只將新增/變動的特店送往 Gemini（可選）
+            "by_district": False            # 每個行政區只查詢一次，再依行業別拆分（可選）
         }
     
     Returns:
@@ -618,6 +1764,13 @@ def run_pipeline_for_config(config):
         districts = config.get("districts", None)
         output_dir = config.get("output_dir", "outputs")
         use_raw = config.get("use_raw", False)
+        scrape_concurrency = config.get("scrape_concurrency")
+        scrape_rps = config.get("scrape_rps")
+        response_cache = make_response_cache(config.get("cache_dir"), config.get("cache_ttl"),
+                                             replay=config.get("replay", False))
+        delta = config.get("delta", False)
+        incremental = config.get("incremental", False)
+        by_district = config.get("by_district", False)
         
         # 驗證必要的環境
         if not GOOGLE_API_KEY:
@@ -658,6 +1811,36 @@ def run_pipeline_for_config(config):
 
         # 執行爬蟲 - 遍歷所有行政區和行業
         for zip_code, zip_name in target_zips.items():
+            # 行政區模式：整個行政區只查詢一次 (行業別欄位為 NULL)，再依「行業別」欄位拆分
+            district_frames = None
+            district_fingerprints = None
+            district_unchanged = False
+            district_ok = True  # 所有行業都成功才記錄行政區指紋
+            scrape_failed = False
+            if by_district:
+                district_suffix = f"{city}_{zip_code}_NULL"
+                pending = [ind for ind in industries
+                           if not os.path.exists(os.path.join(output_dir, f"final_{city}_{zip_code}_{ind}.parquet"))]
+                try:
+                    if not pending:
+                        district_frames = {}
+                    elif delta:
+                        df_district, district_fingerprints, delta_summary = run_delta_scraper_batch(
+                            city, city_name, zip_code, zip_name, "NULL", "全部行業",
+                            previous=load_page_fingerprints(district_suffix, output_dir),
+                            concurrency=scrape_concurrency, rps=scrape_rps, cache=response_cache)
+                        district_unchanged = delta_summary["unchanged"]
+                        district_frames = split_by_industry(df_district, industries)
+                    else:
+                        district_frames = run_scraper_district(city, city_name, zip_code, zip_name, industries,
+                                                               concurrency=scrape_concurrency, rps=scrape_rps,
+                                                               cache=response_cache)
+                except Exception as e:
+                    logger.error(f"[ERROR] Failed to scrape {city_name} - {zip_name}: {str(e)}")
+                    district_frames = None
+                    district_ok = False
+                    scrape_failed = True
+
             for ind_code in industries:
                 if ind_code not in INDUSTRY_CODES:
                     continue
@@ -667,7 +1850,6 @@ def run_pipeline_for_config(config):
                 
                 try:
                     file_suffix = f"{city}_{zip_code}_{ind_code}"
-                    raw_file_path = os.path.join(output_dir, f"raw_{file_suffix}.parquet")
                     final_file_path = os.path.join(output_dir, f"final_{file_suffix}.parquet")
                     
                     # 跳過已存在的檔案
@@ -677,72 +1859,60 @@ def run_pipeline_for_config(config):
                         continue
                     
                     # 1. Scrape
-                    logger.info(f"[SCRAPE] {city_name} - {zip_name} - {ind_name}")
-                    df_batch = run_scraper_batch(city, city_name, zip_code, zip_name, ind_code, ind_name)
-                    
-                    if df_batch.empty:
-                        logger.info(f"[INFO] No data for {zip_name} - {ind_name}.")
-                        success_count += 1
-                        continue
-                    
-                    # 2. Clean & Geocode & Tag
-                    df_batch = run_cleaner(df_batch)
-                    cache_path = os.path.join(tempfile.gettempdir(), f"cache_{city}_{zip_code}_{ind_code}.parquet")
-                    df_batch = run_geocoder_with_cache(df_batch, tmp_cache_path=cache_path)
-                    df_batch = add_hidden_tags(df_batch)
-                    
-                    # Save Raw
-                    if not df_batch.empty:
-                        atomic_write_parquet(raw_file_path, df_batch)
-                        logger.info(f"[INFO] Saved raw records to {raw_file_path}")
-                    
-                    # 3. Gemini Processing
-                    df_for_ai = df_batch if not use_raw else pd.read_parquet(raw_file_path)
-                    
-                    if df_for_ai.empty:
-                        logger.info("[INFO] No data for AI processing.")
-                        success_count += 1
-                        continue
-                    
-                    batch_results = run_gemini_processor(df_for_ai, city, zip_code, ind_code)
-                    
-                    if batch_results:
-                        final_df = pd.DataFrame(batch_results)
-                        
-                        # 資料型別轉換和格式化
-                        for col in ['id', 'phone', 'name']:
-                            if col in final_df.columns:
-                                final_df[col] = final_df[col].astype(str)
-
-                        final_df['ind'] = ind_name
-                        
-                        for col in ['lat', 'lng']:
-                            if col in final_df.columns:
-                                final_df[col] = pd.to_numeric(final_df[col], errors='coerce')
-                        
-                        # 填充 NaN 值
-                        str_cols = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'phone', 'review_summary', 'rating', 'price_level', 'hidden_tags']
-                        for col in str_cols:
-                            if col in final_df.columns:
-                                final_df[col] = final_df[col].fillna("").astype(str)
-                        
-                        # 重新排列欄位
-                        target_order = ['id', 'name', 'ind', 'city', 'district', 'address', 'floor', 'lat', 'lng', 'phone', 'review_summary', 'rating', 'price_level']
-                        if 'hidden_tags' in final_df.columns:
-                            target_order.append('hidden_tags')
-                        
-                        final_cols = [c for c in target_order if c in final_df.columns]
-                        final_df = final_df[final_cols]
-                        
-                        if atomic_write_parquet(final_file_path, final_df):
-                            logger.info(f"[SUCCESS] {city_name} - {zip_name} - {ind_name}: {len(final_df)} records")
+                    fingerprints = None
+                    if by_district:
+                        if scrape_failed:
+                            logger.warning(f"[SKIP] {zip_name} - {ind_name}: district scrape failed.")
+                            continue
+                        if district_unchanged:
+                            logger.info(f"[DELTA] {zip_name} - {ind_name} unchanged, keeping previous fragment.")
+                            success_count += 1
+                            continue
+                        df_batch = district_frames.get(ind_code, pd.DataFrame())
+                    elif delta:
+                        # 差異模式：清單未變動則保留上次的 fragment
+                        logger.info(f"[SCRAPE] {city_name} - {zip_name} - {ind_name}")
+                        df_batch, fingerprints, delta_summary = run_delta_scraper_batch(
+                            city, city_name, zip_code, zip_name, ind_code, ind_name,
+                            previous=load_page_fingerprints(file_suffix, output_dir),
+                            concurrency=scrape_concurrency, rps=scrape_rps, cache=response_cache)
+                        if delta_summary["unchanged"]:
+                            logger.info(f"[DELTA] {zip_name} - {ind_name} unchanged, keeping previous fragment.")
                             success_count += 1
+                            continue
                     else:
-                        logger.warning("[WARN] No results from Gemini.")
-                        success_count += 1
+                        # 串流模式：邊爬邊清洗/Geocoding/標籤
+                        logger.info(f"[SCRAPE] {city_name} - {zip_name} - {ind_name}")
+                        df_batch = iter_scraper_batches(city, city_name, zip_code, zip_name, ind_code, ind_name,
+                                                        concurrency=scrape_concurrency, rps=scrape_rps,
+                                                        cache=response_cache)
+                    
+                    if isinstance(df_batch, pd.DataFrame):
+                        if df_batch.empty:
+                            logger.info(f"[INFO] No data for {zip_name} - {ind_name}.")
+                            if fingerprints is not None:
+                                save_page_fingerprints(fingerprints, file_suffix, output_dir)
+                            success_count += 1
+                            continue
+                        df_batch = [df_batch]
+                    
+                    # 2-3. Clean & Geocode & Tag & Gemini
+                    # 差異模式一律以 incremental 處理完整清單：未變動的特店沿用上次結果，已下架的特店移除
+                    written = _process_cell(df_batch, city, city_name, zip_code, zip_name, ind_code, ind_name,
+                                            output_dir, use_raw=use_raw, incremental=incremental or delta)
+                    if written and fingerprints is not None:
+                        save_page_fingerprints(fingerprints, file_suffix, output_dir)
+                    elif written is False:
+                        district_ok = False
+                    success_count += 1
                 
                 except Exception as e:
+                    district_ok = False
                     logger.error(f"[ERROR] Failed to process {city_name} - {zip_name} - {ind_name}: {str(e)}")
+
+            # 行政區內所有行業都完成後才記錄指紋，避免下次誤判為未變動
+            if district_fingerprints is not None and district_ok:
+                save_page_fingerprints(district_fingerprints, district_suffix, output_dir)
         
         # 返回結果
         result = {
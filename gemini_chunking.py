@@ -0,0 +1,67 @@
+"""
+Gemini chunk 大小控制
+依 token 預算把待處理的列切成 chunk (每列的 token 數以 SDK 的 count_tokens 校正後估計)，
+並以 AIMD 依輸出被截斷 (MAX_TOKENS) 的比例調整每個 chunk 的列數上限
+"""
+
+import threading
+
+
+def next_chunk_end(row_tokens, start, token_budget, max_rows):
+    """End (exclusive) of the chunk starting at `start`.
+
+    Rows are added in order while the chunk stays within `token_budget`
+    estimated tokens and `max_rows` rows; a chunk always holds at least one
+    row, even if that row alone exceeds the budget.
+    """
+    end = start + 1
+    total = row_tokens[start]
+    limit = min(len(row_tokens), start + max(1, int(max_rows)))
+    while end < limit and total + row_tokens[end] <= token_budget:
+        total += row_tokens[end]
+        end += 1
+    return end
+
+
+class AdaptiveChunkSizer:
+    """AIMD limit on the number of rows per Gemini chunk, driven by output truncation.
+
+    `record(rows, truncated)` is called for every response. A truncated
+    response lowers the limit to half the rows of that chunk, so several
+    cut-off chunks of the same size in flight count once (multiplicative
+    decrease); after `window` complete responses from full-size chunks the
+    limit grows by `increase_step` rows (additive increase). The limit
+    settles where truncation is rare; `truncation_rate` is the share of
+    responses that were cut off.
+    """
+
+    def __init__(self, max_rows=30, min_rows=1, ceiling=60, window=10, increase_step=2):
+        self.min_rows = max(1, int(min_rows))
+        self.ceiling = max(self.min_rows, int(ceiling))
+        self.max_rows = min(self.ceiling, max(self.min_rows, int(max_rows)))
+        self.window = max(1, int(window))
+        self.increase_step = max(1, int(increase_step))
+        self.responses = 0
+        self.truncated = 0
+        self._clean_streak = 0
+        self._lock = threading.Lock()
+
+    @property
+    def truncation_rate(self):
+        return self.truncated / self.responses if self.responses else 0.0
+
+    def record(self, rows, truncated):
+        with self._lock:
+            self.responses += 1
+            if truncated:
+                self.truncated += 1
+                self._clean_streak = 0
+                limit = max(self.min_rows, int(rows) // 2)
+                if limit < self.max_rows:
+                    self.max_rows = limit
+                    print(f"[WARN] Gemini output truncated at {rows} rows, chunk limit -> {self.max_rows} rows")
+            elif rows >= self.max_rows:
+                self._clean_streak += 1
+                if self._clean_streak >= self.window:
+                    self._clean_streak = 0
+                    self.max_rows = min(self.ceiling, self.max_rows + self.increase_step)
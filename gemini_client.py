@@ -0,0 +1,153 @@
+"""
+Gemini client 介面與 context cache 管理
+管線只透過 GeminiClient 呼叫模型 (generate / count_tokens / context cache)，GenAIClient 以 google-genai SDK 實作；
+benchmark 與測試可換成本地替身 (benchmarks/gemini_stub.py)。
+ContextCacheRegistry 為每組靜態指令 (規則 + 行業說明) 建立一次 context cache 並自行追蹤到期時間
+"""
+
+import asyncio
+import hashlib
+import time
+
+from google.genai import types
+
+# 模型無法快取此指令 (token 數低於下限或不支援 context cache) 時的錯誤訊息
+_CACHE_UNSUPPORTED_HINTS = ("too small", "min_total_token_count", "not supported", "unsupported", "does not support")
+
+
+def cache_unsupported(error):
+    """True if the API refused to create a context cache for good (instruction too small, caching not supported)."""
+    message = str(error).lower()
+    return getattr(error, "code", None) == 400 and any(hint in message for hint in _CACHE_UNSUPPORTED_HINTS)
+
+
+class GeminiClient:
+    """Interface the enrichment pipeline uses to talk to Gemini.
+
+    `generate` returns an object shaped like a genai
+    GenerateContentResponse (`.text`, `.candidates[].finish_reason`,
+    optional `.usage_metadata`). A request uses either
+    `system_instruction` or `cached_content` (the name returned by
+    `create_cache`, which holds the instruction and tools); with
+    `response_schema` the answer is a JSON array.
+    """
+
+    model = None
+
+    async def generate(self, contents, system_instruction=None, cached_content=None, response_schema=None):
+        raise NotImplementedError
+
+    async def count_tokens(self, contents):
+        """Number of input tokens of `contents`."""
+        raise NotImplementedError
+
+    async def create_cache(self, system_instruction, ttl_seconds, display_name=None):
+        """Register `system_instruction` as cached content; returns (name, expire_time as epoch seconds)."""
+        raise NotImplementedError
+
+
+class GenAIClient(GeminiClient):
+    """GeminiClient over a google-genai `genai.Client`; every request may use Google Search."""
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+
+    @staticmethod
+    def _tools():
+        return [types.Tool(google_search=types.GoogleSearch())]
+
+    async def generate(self, contents, system_instruction=None, cached_content=None, response_schema=None):
+        config = {}
+        if cached_content:
+            # 指令與 tools 已存於 cached content，請求中不可再指定
+            config["cached_content"] = cached_content
+        else:
+            config["tools"] = self._tools()
+            if system_instruction:
+                config["system_instruction"] = system_instruction
+        if response_schema is not None:
+            config.update(response_mime_type="application/json", response_schema=response_schema)
+        return await self.client.aio.models.generate_content(
+            model=self.model, contents=contents, config=types.GenerateContentConfig(**config))
+
+    async def count_tokens(self, contents):
+        response = await self.client.aio.models.count_tokens(model=self.model, contents=contents)
+        return response.total_tokens
+
+    async def create_cache(self, system_instruction, ttl_seconds, display_name=None):
+        cache = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(system_instruction=system_instruction, tools=self._tools(),
+                                                   ttl=f"{int(ttl_seconds)}s", display_name=display_name))
+        expire_time = cache.expire_time.timestamp() if cache.expire_time else time.time() + ttl_seconds
+        return cache.name, expire_time
+
+
+class ContextCacheRegistry:
+    """Context caches of static instructions, one per (model, instruction text), with their expiry tracked locally.
+
+    `get` returns a cache name that stays valid for at least `margin`
+    seconds, creating a new cache (TTL `ttl` seconds) when there is none
+    or the current one is about to expire; concurrent callers share one
+    creation. Caches are never deleted, they lapse after their TTL. If the
+    model refuses to cache an instruction (too few tokens, no caching
+    support) the instruction is remembered and `get` returns None, so
+    callers send it as a system instruction instead. Other creation errors
+    (network, 5xx) are not remembered: until creation is tried again after
+    `retry_delay` seconds, `get` returns the current cache while it has
+    not expired, else None.
+    Meant to be used from a single event loop.
+    """
+
+    def __init__(self, ttl=3600, margin=120, retry_delay=30):
+        self.ttl = ttl
+        self.margin = margin
+        self.retry_delay = retry_delay
+        self.created = 0
+        self._caches = {}
+        self._unsupported = set()
+        self._retry_at = {}
+        self._locks = {}
+
+    @staticmethod
+    def _key(client, system_instruction):
+        digest = hashlib.sha1(system_instruction.encode("utf-8")).hexdigest()[:16]
+        return f"{client.model}:{digest}"
+
+    async def get(self, client, system_instruction, display_name=None):
+        key = self._key(client, system_instruction)
+        if key in self._unsupported:
+            return None
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._caches.get(key)
+            if entry and entry[1] - time.time() > self.margin:
+                return entry[0]
+            # 重建失敗時，尚未過期的舊 cache 仍可使用
+            current = entry[0] if entry and entry[1] > time.time() else None
+            if time.time() < self._retry_at.get(key, 0):
+                return current
+            try:
+                name, expire_time = await client.create_cache(system_instruction, self.ttl, display_name)
+            except Exception as e:
+                if cache_unsupported(e):
+                    self._unsupported.add(key)
+                    print(f"[WARN] Context cache unavailable for {display_name or key}, using a system instruction: {e}")
+                else:
+                    self._retry_at[key] = time.time() + self.retry_delay
+                    print(f"[WARN] Context cache creation failed for {display_name or key}, "
+                          f"retrying in {self.retry_delay}s: {e}")
+                    return current
+                return None
+            self._retry_at.pop(key, None)
+            self._caches[key] = (name, expire_time)
+            self.created += 1
+            print(f"[INFO] Context cache {name} created for {display_name or key} (ttl {self.ttl}s)")
+            return name
+
+    def invalidate(self, name):
+        """Forget a cache the API no longer knows (expired early or deleted)."""
+        for key, entry in list(self._caches.items()):
+            if entry[0] == name:
+                del self._caches[key]
@@ -0,0 +1,191 @@
+"""
+GCS 上的分片、append-only Geocoding 快取
+每個 worker 只新增小型且不可變的 delta 檔 (依地址鍵雜湊分片)，不再對整份快取做讀取-修改-寫回；
+讀取端合併各分片的 base 與 delta，merge 階段再由 compact_geocoding_cache 將 delta 併回 base，
+並重寫舊版的 geocoding_cache.parquet 供 sheet_sync 使用
+
+    geocoding_cache/shard=<h>/base.parquet
+    geocoding_cache/shard=<h>/delta-<毫秒時間戳>-<隨機碼>.parquet
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import time
+import uuid
+
+import pandas as pd
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from address_parser import canonical_address
+from geocoding_store import SOURCE_RANK
+
+SHARDS_PREFIX = "geocoding_cache/"
+LEGACY_BLOB_NAME = "geocoding_cache.parquet"
+BASE_NAME = "base.parquet"
+CACHE_COLUMNS = ["full_address_key", "lat", "lng", "updated_at", "source", "confidence"]
+# 無法解析的地址 (lat/lng 為空) 另帶失敗原因、嘗試次數與下次可重試時間
+FAILURE_COLUMNS = ["reason", "attempts", "next_eligible"]
+
+
+def shard_of(key):
+    """Shard of an address key: first hex digit of its SHA-1 (16 shards)."""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:1]
+
+
+def _shard_prefix(shard):
+    return f"{SHARDS_PREFIX}shard={shard}/"
+
+
+def shard_from_name(name):
+    part = name[len(SHARDS_PREFIX):].split("/", 1)[0]
+    return part[len("shard="):] if part.startswith("shard=") else None
+
+
+def is_base(name):
+    return name.endswith("/" + BASE_NAME)
+
+
+def read_cache_blob(blob, canonicalize=False):
+    """Download one cache object as a DataFrame (rows without updated_at get 0).
+
+    Objects written before failures or sources were recorded lack those
+    columns; they are added empty (an empty source means "maps").
+
+    `canonicalize` re-keys legacy entries, whose keys were raw concatenated
+    addresses, with canonical_address.
+    """
+    df = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+    if "updated_at" not in df.columns:
+        df["updated_at"] = 0.0
+    for col in FAILURE_COLUMNS + ["source", "confidence"]:
+        if col not in df.columns:
+            df[col] = None
+    if canonicalize and not df.empty:
+        df["full_address_key"] = df["full_address_key"].map(canonical_address)
+        df = df[df["full_address_key"] != ""]
+    return df
+
+
+def latest_rows(df):
+    """Keep one row per address key: coordinates beat a failure record, then the source (manual > maps > gemini), then the newest."""
+    if df.empty:
+        return df
+    # 來源缺少或空字串 (經 sheet 匯出/匯入) 視為 maps
+    df = df.assign(_resolved=df["lat"].notna(), _rank=df["source"].map(SOURCE_RANK).fillna(SOURCE_RANK["maps"]))
+    df = df.sort_values(["_resolved", "_rank", "updated_at"], kind="stable")
+    df = df.drop_duplicates(subset=["full_address_key"], keep="last")
+    return df.drop(columns=["_resolved", "_rank"]).reset_index(drop=True)
+
+
+def list_cache_blobs(bucket):
+    """All shard objects (bases and deltas), sorted by name; metadata only."""
+    return sorted(bucket.list_blobs(prefix=SHARDS_PREFIX), key=lambda b: b.name)
+
+
+def append_geocoding_deltas(bucket, rows, tmp_path=None, max_retries=3):
+    """Write new cache rows as one immutable delta object per shard.
+
+    Objects get unique names and are created with if_generation_match=0,
+    so concurrent workers never conflict and nothing is read first.
+    Returns {object name: generation} of the uploaded deltas, so the
+    writer can mark them as already synced.
+    """
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return {}
+    if "updated_at" not in df.columns:
+        df["updated_at"] = time.time()
+    if not tmp_path:
+        tmp_path = os.path.join(tempfile.gettempdir(), f"geocode_delta_{os.getpid()}.parquet")
+
+    written = 0
+    uploaded = {}
+    stamp = int(time.time() * 1000)
+    for shard, part in df.groupby(df["full_address_key"].map(shard_of)):
+        name = f"{_shard_prefix(shard)}delta-{stamp}-{uuid.uuid4().hex[:8]}.parquet"
+        part.to_parquet(tmp_path, index=False)
+        for attempt in range(max_retries):
+            try:
+                blob = bucket.blob(name)
+                blob.upload_from_filename(tmp_path, if_generation_match=0)
+                uploaded[name] = blob.generation
+                written += len(part)
+                break
+            except Exception as e:
+                print(f"[WARN] Geocoding delta upload failed (attempt {attempt + 1}/{max_retries}): {e}")
+                time.sleep(0.5 * (attempt + 1))
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+    print(f"[INFO] Geocoding cache: appended {written}/{len(df)} entries as delta files")
+    return uploaded
+
+
+def compact_geocoding_cache(bucket):
+    """Fold each shard's deltas into its base, then rewrite the legacy single-file cache.
+
+    The legacy geocoding_cache.parquet is folded in too, so entries written
+    before sharding are carried into the shard bases. Each base is replaced
+    with if_generation_match; a shard whose base changed meanwhile is left
+    for the next run. Only the deltas that were read are deleted, so deltas
+    appended during compaction survive. Returns a summary dict.
+    """
+    legacy_blob = bucket.blob(LEGACY_BLOB_NAME)
+    try:
+        legacy = read_cache_blob(legacy_blob, canonicalize=True)
+    except NotFound:
+        legacy = pd.DataFrame(columns=CACHE_COLUMNS)
+    legacy_by_shard = dict(tuple(legacy.groupby(legacy["full_address_key"].map(shard_of)))) if not legacy.empty else {}
+
+    shards = {}
+    for blob in list_cache_blobs(bucket):
+        shard = shard_from_name(blob.name)
+        if shard is not None:
+            shards.setdefault(shard, []).append(blob)
+
+    summary = {"shards": 0, "deltas_folded": 0, "entries": 0, "conflicts": 0}
+    bases = []
+    for shard in sorted(set(shards) | set(legacy_by_shard)):
+        blobs = shards.get(shard, [])
+        base_blob = next((b for b in blobs if is_base(b.name)), None)
+        deltas = [b for b in blobs if not is_base(b.name)]
+
+        frames = [legacy_by_shard[shard]] if shard in legacy_by_shard else []
+        frames += [read_cache_blob(b) for b in ([base_blob] if base_blob else []) + deltas]
+        merged = latest_rows(pd.concat(frames, ignore_index=True))
+
+        buf = io.BytesIO()
+        merged.to_parquet(buf, index=False)
+        try:
+            bucket.blob(_shard_prefix(shard) + BASE_NAME).upload_from_string(
+                buf.getvalue(), content_type="application/octet-stream",
+                if_generation_match=base_blob.generation if base_blob else 0)
+        except PreconditionFailed:
+            print(f"[WARN] Geocoding shard {shard} changed during compaction, skipping")
+            summary["conflicts"] += 1
+            if base_blob:
+                bases.append(read_cache_blob(base_blob))
+            continue
+
+        for delta in deltas:
+            try:
+                delta.delete(if_generation_match=delta.generation)
+            except NotFound:
+                pass
+        bases.append(merged)
+        summary["shards"] += 1
+        summary["deltas_folded"] += len(deltas)
+        summary["entries"] += len(merged)
+
+    # 舊版單檔快取 = 所有分片 base 中有座標的列
+    if bases:
+        all_rows = pd.concat(bases, ignore_index=True)
+        all_rows = all_rows.loc[all_rows["lat"].notna(), CACHE_COLUMNS]
+        buf = io.BytesIO()
+        all_rows.to_parquet(buf, index=False)
+        legacy_blob.upload_from_string(buf.getvalue(), content_type="application/octet-stream")
+    print(f"[INFO] Geocoding cache compacted: {summary}")
+    return summary
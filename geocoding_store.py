@@ -0,0 +1,233 @@
+"""
+本地 Geocoding 快取
+以 SQLite (地址鍵為主鍵) 持久化座標，前面加一層 process 內的 LRU，
+查詢成本與本次要查的地址數成正比，而不是整個快取的大小
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+_SQL_MAX_PARAMS = 900  # SQLite 單一查詢的參數上限 (保守值)
+# 不同來源的座標優先順序：人工修正 (sheet_sync import geo) > Geocoding API > Gemini 回填
+SOURCE_RANK = {"gemini": 0, "maps": 1, "manual": 2}
+_OUTRANKS_SQL = ("CASE excluded.source WHEN 'manual' THEN 2 WHEN 'gemini' THEN 0 ELSE 1 END > "
+                 "CASE COALESCE(geocodes.source, 'maps') WHEN 'manual' THEN 2 WHEN 'gemini' THEN 0 ELSE 1 END")
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize=50_000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeocodingStore:
+    """Persistent address-key -> (lat, lng) store: SQLite on disk, LRU in memory.
+
+    Each entry carries a `source` ("maps" for the Geocoding API, "gemini"
+    for coordinates backfilled from Gemini output, "manual" for corrections
+    imported from the sheet) and a `confidence` flag; an entry is only
+    replaced by one of a higher-ranked source (manual > maps > gemini) or
+    a newer one of the same source.
+    Addresses that could not be geocoded are kept in a separate
+    `geocode_failures` table with the reason, the number of attempts and
+    the time after which they may be retried (see `get_failures`).
+    The database may be shared by several processes on one machine (WAL
+    mode, busy timeout). A small `meta` table records which versions of the
+    GCS cache objects were last merged in, so callers only download objects
+    that have changed (see `get_meta` / `set_meta`).
+    """
+
+    def __init__(self, db_path, lru_size=50_000):
+        self.db_path = db_path
+        self.lru = LRUCache(lru_size)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocodes ("
+                "full_address_key TEXT PRIMARY KEY, lat REAL, lng REAL, updated_at REAL, "
+                "source TEXT, confidence TEXT)")
+            # 舊版資料庫沒有 source / confidence 欄位
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(geocodes)")}
+            for column in ("source", "confidence"):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE geocodes ADD COLUMN {column} TEXT")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_failures ("
+                "full_address_key TEXT PRIMARY KEY, reason TEXT, attempts INTEGER, "
+                "next_eligible REAL, updated_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def get_many(self, keys):
+        """Return {key: (lat, lng)} for the keys that are cached."""
+        found = {}
+        pending = []
+        for key in dict.fromkeys(keys):
+            value = self.lru.get(key)
+            if value is None:
+                pending.append(key)
+            else:
+                found[key] = value
+
+        with self._lock:
+            for i in range(0, len(pending), _SQL_MAX_PARAMS):
+                chunk = pending[i:i + _SQL_MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT full_address_key, lat, lng FROM geocodes WHERE full_address_key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for key, lat, lng in rows:
+                    if lat is None or lng is None: continue
+                    found[key] = (lat, lng)
+                    self.lru.put(key, (lat, lng))
+
+        self.hits += len(found)
+        self.misses += len(dict.fromkeys(keys)) - len(found)
+        return found
+
+    def put_many(self, rows):
+        """Upsert an iterable of (key, lat, lng[, updated_at[, source[, confidence]]]).
+
+        Between entries of the same source, one is only replaced by one at
+        least as recent, otherwise the higher SOURCE_RANK wins, so cache
+        files can be applied in any order.
+        Missing source means "maps".
+        """
+        now = time.time()
+        rows = [(row[0], float(row[1]), float(row[2]), float(row[3]) if len(row) > 3 else now,
+                 (row[4] if len(row) > 4 else None) or "maps", row[5] if len(row) > 5 else None)
+                for row in rows]
+        rows = [row for row in rows if row[0] and row[1] == row[1] and row[2] == row[2]]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO geocodes (full_address_key, lat, lng, updated_at, source, confidence) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(full_address_key) DO UPDATE SET lat = excluded.lat, "
+                "lng = excluded.lng, updated_at = excluded.updated_at, source = excluded.source, "
+                "confidence = excluded.confidence WHERE CASE "
+                "WHEN excluded.source = COALESCE(geocodes.source, 'maps') THEN excluded.updated_at >= geocodes.updated_at "
+                f"ELSE {_OUTRANKS_SQL} END", rows)
+            # 成功解析後，較舊的失敗紀錄不再需要
+            self._conn.executemany(
+                "DELETE FROM geocode_failures WHERE full_address_key = ? AND updated_at <= ?",
+                [(row[0], row[3]) for row in rows])
+        # 是否覆蓋由資料庫判斷 (較舊的列不會覆蓋)，LRU 中的值直接作廢
+        if len(rows) > self.lru.maxsize:
+            self.lru.clear()
+        else:
+            for row in rows:
+                self.lru.pop(row[0])
+        return len(rows)
+
+    def get_failures(self, keys):
+        """Return {key: (reason, attempts, next_eligible)} for keys with a recorded failure."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_MAX_PARAMS):
+                chunk = keys[i:i + _SQL_MAX_PARAMS]
+                rows = self._conn.execute(
+                    "SELECT full_address_key, reason, attempts, next_eligible FROM geocode_failures "
+                    f"WHERE full_address_key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for key, reason, attempts, next_eligible in rows:
+                    found[key] = (reason, attempts, next_eligible)
+        return found
+
+    def put_failures(self, rows):
+        """Upsert an iterable of (key, reason, attempts, next_eligible, updated_at), newest wins."""
+        rows = [(row[0], str(row[1]), int(row[2]), float(row[3]), float(row[4])) for row in rows if row[0]]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO geocode_failures (full_address_key, reason, attempts, next_eligible, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(full_address_key) DO UPDATE SET reason = excluded.reason, "
+                "attempts = excluded.attempts, next_eligible = excluded.next_eligible, "
+                "updated_at = excluded.updated_at WHERE excluded.updated_at >= geocode_failures.updated_at", rows)
+        return len(rows)
+
+    def put_dataframe(self, df):
+        """Upsert a cache DataFrame (full_address_key, lat, lng; optional updated_at, source, confidence).
+
+        Rows without coordinates are failure records and go to
+        `put_failures` (reason, attempts, next_eligible columns).
+        """
+        if df.empty:
+            return 0
+        updated_at = df['updated_at'] if 'updated_at' in df.columns else pd.Series(0.0, index=df.index)
+        ok = df['lat'].notna() & df['lng'].notna()
+        source = df['source'] if 'source' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        confidence = df['confidence'] if 'confidence' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        count = self.put_many(zip(df.loc[ok, 'full_address_key'], df.loc[ok, 'lat'], df.loc[ok, 'lng'],
+                                  updated_at[ok], source[ok].where(source[ok].notna(), None),
+                                  confidence[ok].where(confidence[ok].notna(), None)))
+        failed = df[~ok]
+        if not failed.empty and 'next_eligible' in failed.columns:
+            count += self.put_failures(zip(failed['full_address_key'], failed['reason'].fillna(''),
+                                           failed['attempts'].fillna(1), failed['next_eligible'].fillna(0),
+                                           updated_at[~ok]))
+        return count
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_meta_prefix(self, prefix):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM meta WHERE substr(key, 1, ?) = ?",
+                                      (len(prefix), prefix)).fetchall()
+        return dict(rows)
+
+    def delete_meta(self, keys):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM meta WHERE key = ?", [(key,) for key in keys])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
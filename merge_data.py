@@ -4,6 +4,8 @@ import pandas as pd
 from dotenv import load_dotenv
 from google.cloud import storage
 from pipeline_config import CITIES, ZIP_CODES, INDUSTRY_CODES
+from geocoding_shards import compact_geocoding_cache
+from tag_memo_store import compact_tag_memo
 
 load_dotenv()
 
@@ -176,6 +178,18 @@ def merge_and_upload(output_dir=None):
                 blob = bucket.blob(RAW_BLOB_NAME)
                 blob.upload_from_filename(raw_output_path)
                 print(f"[INFO] Uploaded to gs://{BUCKET_NAME}/{RAW_BLOB_NAME}")
+
+            # Geocoding 快取：將各分片的 delta 併回 base，並重寫 geocoding_cache.parquet
+            try:
+                compact_geocoding_cache(bucket)
+            except Exception as e:
+                print(f"[WARN] Geocoding cache compaction failed: {e}")
+
+            # 標籤 memo：將 delta 併回 tag_memo.parquet
+            try:
+                compact_tag_memo(bucket)
+            except Exception as e:
+                print(f"[WARN] Tag memo compaction failed: {e}")
                 
         except Exception as e:
             print(f"[ERROR] Upload failed: {e}")
@@ -0,0 +1,83 @@
+"""
+NCCC RetailerList 頁面解析
+直接以 lxml XPath 定位「特店名稱」特店表格，輸出欄位陣列 (columnar)，
+取代 pd.read_html 解析整頁所有表格再逐列 iterrows 的做法
+"""
+
+import re
+
+from lxml import html as lxml_html
+
+MERCHANT_COLUMNS = ("特店名稱", "行業別", "電話", "地址")
+
+# 與 pandas.read_html 相同的空白處理規則，確保輸出文字一致
+_RE_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+
+# 只取「自身」含有特店名稱、且不再包住其他表格的儲存格 (排除外層排版用表格)
+_HEADER_CELL_XPATH = "//*[self::td or self::th][contains(., '特店名稱') and not(.//table)]"
+_ROWS_XPATH = "./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr"
+
+
+def is_end_of_list(page_html):
+    """True when the site reports there are no more merchants ("查無資料")."""
+    return "查無資料" in page_html or "查無特店資訊" in page_html
+
+
+def _cell_text(cell):
+    for br in cell.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    return _RE_WHITESPACE.sub(" ", cell.text_content().strip()).strip()
+
+
+def _find_merchant_table(doc):
+    for header_cell in doc.xpath(_HEADER_CELL_XPATH):
+        table = header_cell.getparent()
+        while table is not None and table.tag != "table":
+            table = table.getparent()
+        if table is None:
+            continue
+        rows = table.xpath(_ROWS_XPATH)
+        if not rows:
+            continue
+        header = rows[0].xpath("./td | ./th")
+        if header and header[0] is header_cell and len(header) >= 5:
+            return rows
+    return None
+
+
+def extract_merchant_columns(page_html):
+    """Extract the merchant table of a RetailerList page as column arrays.
+
+    Returns None when the page is the end-of-list marker ("查無資料"),
+    otherwise a dict mapping each of MERCHANT_COLUMNS to a list of strings
+    (all lists empty when the page has no merchant table). Empty cells are
+    returned as "" rather than pandas' "nan".
+    """
+    if is_end_of_list(page_html):
+        return None
+
+    columns = {col: [] for col in MERCHANT_COLUMNS}
+    try:
+        doc = lxml_html.fromstring(page_html)
+    except ValueError:
+        # lxml 不接受帶 encoding 宣告的 str，改以 bytes 解析
+        doc = lxml_html.fromstring(page_html.encode("utf-8"))
+
+    rows = _find_merchant_table(doc)
+    if rows is None:
+        return columns
+
+    width = len(MERCHANT_COLUMNS)
+    for tr in rows[1:]:
+        texts = []
+        for td in tr.xpath("./td | ./th"):
+            text = _cell_text(td)
+            texts.extend([text] * int(td.get("colspan") or 1))
+            if len(texts) >= width:
+                break
+        if not texts or texts[0] == "特店名稱":
+            continue
+        texts.extend([""] * (width - len(texts)))
+        for col, text in zip(MERCHANT_COLUMNS, texts):
+            columns[col].append(text)
+    return columns
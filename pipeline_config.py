@@ -10,6 +10,23 @@ ZIP_CODES = {
     "105": "松山區", "110": "信義區", "115": "南港區", "108": "萬華區"
 }
 
+# 行政區座標範圍 (ZipCode -> (緯度下限, 緯度上限, 經度下限, 經度上限))，
+# 用於檢查 Gemini 回傳的經緯度是否落在該行政區內 (範圍取略大的外接矩形)
+DISTRICT_BOUNDS = {
+    "111": (25.07, 25.21, 121.48, 121.60),  # 士林區
+    "103": (25.05, 25.08, 121.50, 121.53),  # 大同區
+    "106": (25.01, 25.05, 121.52, 121.56),  # 大安區
+    "104": (25.04, 25.09, 121.51, 121.56),  # 中山區
+    "100": (25.01, 25.05, 121.50, 121.53),  # 中正區
+    "114": (25.05, 25.11, 121.55, 121.65),  # 內湖區
+    "116": (24.96, 25.01, 121.53, 121.62),  # 文山區
+    "112": (25.10, 25.21, 121.46, 121.56),  # 北投區
+    "105": (25.04, 25.07, 121.54, 121.58),  # 松山區
+    "110": (25.01, 25.05, 121.55, 121.60),  # 信義區
+    "115": (25.02, 25.07, 121.58, 121.67),  # 南港區
+    "108": (25.01, 25.05, 121.48, 121.51),  # 萬華區
+}
+
 # 行業別代碼表
 INDUSTRY_CODES = {
     "0017": "旅行業", "0009": "旅宿業", "0007": "交通運輸業", "0018": "觀光遊樂業",
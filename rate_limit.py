@@ -0,0 +1,161 @@
+"""
+速率限制工具
+提供執行緒安全的 Token Bucket 與 AIMD 自適應速率控制器，供爬蟲等需要控制請求頻率的模組共用
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    `rate` tokens are added per second up to `capacity`; `acquire()` blocks
+    until a token is available. A rate of 0 (or less) disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate, capacity=None):
+        """Change the refill rate without losing the tokens already accrued."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            if capacity:
+                self.capacity = float(capacity)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self, tokens=1.0):
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def release(self, latency=None, outcome="ok"):
+        """A plain token bucket does not adapt; present for interface parity with AdaptiveRateController."""
+
+
+# 同一個 host 在同一個 process 內共用一個 bucket (多個 thread / 多次呼叫皆受同一速率限制)
+_HOST_BUCKETS = {}
+_HOST_BUCKETS_LOCK = threading.Lock()
+
+
+def get_host_bucket(url, rate, capacity=None):
+    """Return the process-wide TokenBucket for the host of `url`.
+
+    The first caller creates the bucket; later callers asking for a different
+    rate update it, so the most recent configuration wins.
+    """
+    host = urlparse(url).netloc or url
+    with _HOST_BUCKETS_LOCK:
+        bucket = _HOST_BUCKETS.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+            _HOST_BUCKETS[host] = bucket
+        elif bucket.rate != float(rate) or (capacity and bucket.capacity != float(capacity)):
+            bucket.set_rate(rate, capacity)
+        return bucket
+
+
+class AdaptiveRateController:
+    """AIMD controller for request rate and concurrency.
+
+    Each request calls `acquire()` before sending and `release(latency, outcome)`
+    when it completes. After `concurrency` consecutive clean responses the
+    rate grows by `increase_step` req/s and concurrency by one (additive
+    increase); a timeout, 5xx/429 (`outcome="throttled"`) or a response slower
+    than `slow_threshold` seconds halves both (multiplicative decrease), at
+    most once per `cooldown` seconds so one burst of failures counts once.
+    """
+
+    def __init__(self, rate=3.0, concurrency=1, min_rate=0.5, max_rate=20.0,
+                 max_concurrency=8, slow_threshold=5.0, increase_step=0.5,
+                 decrease_factor=0.5, cooldown=None):
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.slow_threshold = float(slow_threshold)
+        self.increase_step = float(increase_step)
+        self.decrease_factor = float(decrease_factor)
+        self.cooldown = float(cooldown) if cooldown is not None else self.slow_threshold
+
+        self.concurrency = min(self.max_concurrency, max(1, int(concurrency)))
+        self.bucket = TokenBucket(self._clamp_rate(rate), capacity=self.concurrency)
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._clean_streak = 0
+        self._last_decrease = 0.0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def _clamp_rate(self, rate):
+        return min(self.max_rate, max(self.min_rate, float(rate)))
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.concurrency:
+                self._cond.wait()
+            self._in_flight += 1
+        self.bucket.acquire()
+
+    def release(self, latency=None, outcome="ok"):
+        """Record a finished request.
+
+        `outcome` is "ok", "throttled" (timeout / 5xx / 429) or "error"
+        (any other failure, which does not move the rate either way).
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if outcome == "throttled" or (outcome == "ok" and latency is not None and latency > self.slow_threshold):
+                self._decrease()
+            elif outcome == "ok":
+                self._clean_streak += 1
+                if self._clean_streak >= self.concurrency:
+                    self._increase()
+            self._cond.notify_all()
+
+    def _increase(self):
+        self._clean_streak = 0
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+        self.bucket.set_rate(self._clamp_rate(self.rate + self.increase_step), capacity=self.concurrency)
+
+    def _decrease(self):
+        self._clean_streak = 0
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.concurrency = max(1, int(self.concurrency * self.decrease_factor))
+        self.bucket.set_rate(self._clamp_rate(self.rate * self.decrease_factor), capacity=self.concurrency)
+        print(f"[WARN] Backing off: rate={self.rate:.2f} req/s, concurrency={self.concurrency}")
+
+    def to_dict(self):
+        with self._cond:
+            return {"rate": round(self.rate, 3), "concurrency": self.concurrency, "updated_at": time.time()}
+
+    def load_dict(self, state):
+        """Restore rate/concurrency saved by `to_dict()` (clamped to the current bounds)."""
+        with self._cond:
+            self.concurrency = min(self.max_concurrency, max(1, int(state.get("concurrency", self.concurrency))))
+            self.bucket.set_rate(self._clamp_rate(state.get("rate", self.rate)), capacity=self.concurrency)
+            self._cond.notify_all()
@@ -0,0 +1,88 @@
+"""
+爬蟲 HTTP 回應快取
+以 (request_val, page) 為鍵，將 NCCC 原始回應以內容雜湊 (SHA-256) 存放於本地磁碟，
+支援 TTL 過期與僅讀快取的離線重播 (replay) 模式
+"""
+
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_TTL = 24 * 3600
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a page was never recorded."""
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of raw RetailerList responses.
+
+    Layout under `cache_dir`:
+        objects/<sha[:2]>/<sha>.html   response bodies, named by their SHA-256
+        index/<key>/<page>.json        {request_val, page, sha256, fetched_at}
+
+    Identical bodies (e.g. the many "查無資料" pages) are stored once. Every
+    file is written to a temp name and os.replace()d, so parallel processes
+    can share one cache directory. In `replay` mode entries never expire and
+    `get()` raises CacheMissError instead of returning None.
+    """
+
+    def __init__(self, cache_dir, ttl=DEFAULT_TTL, replay=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "index"), exist_ok=True)
+
+    def _index_path(self, request_val, page):
+        key = hashlib.sha1(request_val.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "index", key, f"{page}.json")
+
+    def _object_path(self, sha):
+        return os.path.join(self.cache_dir, "objects", sha[:2], f"{sha}.html")
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, request_val, page):
+        """Return the cached body, or None if missing, expired or corrupt."""
+        body = None
+        try:
+            with open(self._index_path(request_val, page), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.replay or not self.ttl or time.time() - entry["fetched_at"] <= self.ttl:
+                with open(self._object_path(entry["sha256"]), "rb") as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() == entry["sha256"]:
+                    body = data.decode("utf-8")
+        except (OSError, ValueError, KeyError):
+            body = None
+
+        if body is None:
+            self.misses += 1
+            if self.replay:
+                raise CacheMissError(f"Page {page} of {request_val} is not in the replay cache")
+        else:
+            self.hits += 1
+        return body
+
+    def put(self, request_val, page, body):
+        data = body.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        obj_path = self._object_path(sha)
+        try:
+            if not os.path.exists(obj_path):
+                self._write_atomic(obj_path, data)
+            entry = {"request_val": request_val, "page": page, "sha256": sha, "fetched_at": time.time()}
+            self._write_atomic(self._index_path(request_val, page), json.dumps(entry).encode("utf-8"))
+        except OSError as e:
+            print(f"[WARN] Failed to cache page {page}: {e}")
@@ -32,6 +32,9 @@ class PipelineConfig:
     districts: List[str] = None   # 特定行政區 (若為空則全部)
     batch_size: int = 30   # 一批次處理多少筆記錄
     retry_count: int = 3   # 失敗重試次數
+    delta: bool = False    # 差異爬蟲：清單未變動的 cell 直接跳過，只處理新增/變動的特店
+    by_district: bool = False  # 每個行政區只查詢一次 (行業別 NULL)，再依「行業別」欄位拆分
+    incremental: bool = False  # 完整爬取，但只將新增/變動的特店送往 Gemini，其餘沿用上次結果
     
     def to_dict(self) -> Dict:
         return {
@@ -39,7 +42,10 @@ class PipelineConfig:
             "industries": self.industries,
             "districts": self.districts,
             "batch_size": self.batch_size,
-            "retry_count": self.retry_count
+            "retry_count": self.retry_count,
+            "delta": self.delta,
+            "by_district": self.by_district,
+            "incremental": self.incremental
         }
 
 @dataclass
@@ -72,7 +78,8 @@ TAIPEI_FULL_DAILY = SchedulerConfig(
         PipelineConfig(
             city="001",  # 台北市
             industries=["0009", "0008", "0017", "0007", "0018"], # 包含所有主要行業
-            districts=None # None 代表全部行政區 (由 Master 自動派工)
+            districts=None, # None 代表全部行政區 (由 Master 自動派工)
+            delta=True      # 每晚只重抓有變動的 cell
         )
     ]
 )
@@ -0,0 +1,67 @@
+"""
+差異爬蟲 (Delta Scrape) 的頁面指紋
+記錄上次執行每一頁的指紋與每筆特店的雜湊，用於判斷清單是否變動以及找出變動的列
+"""
+
+import hashlib
+import time
+
+from nccc_parser import MERCHANT_COLUMNS
+
+
+def row_hash(name, ind, phone, addr):
+    return hashlib.sha1("\x1f".join((name, ind, phone, addr)).encode("utf-8")).hexdigest()[:16]
+
+
+def page_row_hashes(page_columns):
+    return [row_hash(*row) for row in zip(*(page_columns[col] for col in MERCHANT_COLUMNS))]
+
+
+def page_fingerprint(page_columns):
+    """Fingerprint of one page: its row hashes in order."""
+    return hashlib.sha1("|".join(page_row_hashes(page_columns)).encode("utf-8")).hexdigest()
+
+
+class PageFingerprints:
+    """Per-cell scrape state: ordered page fingerprints plus the set of row hashes.
+
+    `pages[i]` is the fingerprint of page i + 1; only non-empty pages are
+    recorded, so `len(pages)` is the last page that had merchants.
+    `full_scrape_at` is when the cell was last scraped without fingerprints.
+    """
+
+    def __init__(self, request_val, pages=None, row_hashes=None, updated_at=None, full_scrape_at=None):
+        self.request_val = request_val
+        self.pages = list(pages or [])
+        self.row_hashes = set(row_hashes or [])
+        self.updated_at = updated_at
+        self.full_scrape_at = full_scrape_at
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+    def fingerprint(self, page):
+        return self.pages[page - 1] if 0 < page <= len(self.pages) else None
+
+    def add_page(self, page, page_columns):
+        while len(self.pages) < page - 1:
+            self.pages.append("")  # 該頁抓取失敗或為空白頁
+        self.pages.append(page_fingerprint(page_columns))
+        self.row_hashes.update(page_row_hashes(page_columns))
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            "request_val": self.request_val,
+            "pages": self.pages,
+            "row_hashes": sorted(self.row_hashes),
+            "updated_at": self.updated_at or now,
+            "full_scrape_at": self.full_scrape_at or now,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # 舊版狀態沒有 full_scrape_at，以 updated_at 代替
+        return cls(data["request_val"], data.get("pages"), data.get("row_hashes"), data.get("updated_at"),
+                   data.get("full_scrape_at", data.get("updated_at")))
@@ -2,12 +2,16 @@ import os
 import io
 import json
 import glob
+import time
 import pandas as pd
 import gspread
 from dotenv import load_dotenv
 from google.oauth2.service_account import Credentials
 from google.cloud import storage
 
+from address_parser import canonical_address
+from geocoding_shards import append_geocoding_deltas
+
 # 載入 .env 檔案中的環境變數
 load_dotenv()
 
@@ -127,6 +131,35 @@ def save_to_gcs(df, blob_name):
     
     print("[INFO] Upload complete.")
 
+def save_geo_corrections(new_df, blob_name):
+    """將 Sheet 上修改過的座標以 source=manual 的 delta 寫入分片快取
+
+    worker 與 compaction 都以分片為準，只覆寫 geocoding_cache.parquet 的修正會在下次 compaction 時被蓋掉；
+    manual 來源優先於 Geocoding API 與 Gemini 的結果。
+    """
+    if 'full_address_key' not in new_df.columns:
+        print("[WARN] Sheet 缺少 full_address_key 欄位，略過人工修正。")
+        return
+    current = get_dataframe(blob_name)
+    df = new_df[['full_address_key', 'lat', 'lng']].copy()
+    df['full_address_key'] = df['full_address_key'].astype(str).map(canonical_address)
+    df = df[(df['full_address_key'] != "") & df['lat'].notna() & df['lng'].notna()]
+    if not current.empty:
+        current = current[['full_address_key', 'lat', 'lng']].drop_duplicates('full_address_key', keep='last')
+        df = df.merge(current, on='full_address_key', how='left', suffixes=('', '_current'))
+        # Sheet 來回轉換會有浮點誤差
+        changed = (df['lat_current'].isna() | ((df['lat'] - df['lat_current']).abs() > 1e-7)
+                   | ((df['lng'] - df['lng_current']).abs() > 1e-7))
+        df = df.loc[changed, ['full_address_key', 'lat', 'lng']]
+    if df.empty:
+        print("[INFO] 沒有修改過的座標。")
+        return
+
+    bucket = storage.Client().bucket(BUCKET_NAME)
+    rows = df.assign(updated_at=time.time(), source="manual", confidence="high")
+    append_geocoding_deltas(bucket, rows)
+    print(f"[INFO] {len(rows)} 筆人工修正的座標已寫入分片快取 (source=manual)。")
+
 def write_to_sheet(df, sheet_name):
     """將 DataFrame 寫入指定的 Google Sheet 工作表"""
     client = get_gspread_client()
@@ -240,6 +273,9 @@ def sync_from_sheet():
     for col in ['phone', 'id']:
         if col in new_df.columns:
             new_df[col] = new_df[col].astype(str)
+
+    if CURRENT_KEY == "geo":
+        save_geo_corrections(new_df, blob_name)
         
     save_to_gcs(new_df, blob_name)
     print(f"[SUCCESS] Imported from '{sheet_name}' to GCS '{blob_name}'.")
@@ -0,0 +1,201 @@
+"""
+隱藏標籤的同義詞比對
+將 SYNONYMS_MAP 所有同義詞 token 編成一個 Aho-Corasick 自動機，每個店名只需掃描一次
+即可找出所有命中的品牌，成本與店名長度成正比，不隨品牌數增加；
+模糊比對則以字元計數先排除不可能達標的組合，再以 rapidfuzz.process.cdist 多核心批次計算；
+TagMemo 記住每個店名的結果 (以 SYNONYMS_MAP 的雜湊判斷是否失效)，重複出現的連鎖店名只需查表
+"""
+
+import hashlib
+import json
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher (Aho-Corasick automaton).
+
+    Built from (pattern, value) pairs; `find(text)` returns the set of
+    values whose pattern occurs anywhere in `text`, the same result as
+    testing `pattern in text` for every pattern.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        outputs = [set()]
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                node = nxt
+            outputs[node].add(value)
+
+        # BFS 建立 failure link，並把 failure 節點的輸出併入，搜尋時不需再沿鏈走訪
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                outputs[nxt] |= outputs[self._fail[nxt]]
+        self._out = [frozenset(o) for o in outputs]
+
+    def __len__(self):
+        return len(self._goto)
+
+    def find(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+def build_synonym_matcher(synonyms):
+    """Automaton over the lower-cased whitespace tokens of each synonym string, mapping to its key.
+
+    Matches exactly what `token in name.lower()` finds for each token of
+    `str(v).lower().split()`.
+    """
+    return AhoCorasick((token, key) for key, value in synonyms.items() for token in str(value).lower().split())
+
+
+def _char_counts(strings, vocab):
+    """Dense (len(strings), len(vocab)) matrix of per-string character counts; chars outside vocab are ignored."""
+    counts = np.zeros((len(strings), len(vocab)), dtype=np.float32)
+    for i, text in enumerate(strings):
+        for ch in text:
+            j = vocab.get(ch)
+            if j is not None:
+                counts[i, j] += 1
+    return counts
+
+
+def fuzzy_synonym_tags(names, synonyms, score_cutoff=80, workers=-1, chunk_size=2048):
+    """For each lower-cased name, the set of keys whose lower-cased synonym string has
+    fuzz.partial_ratio(name, synonym) >= score_cutoff.
+
+    partial_ratio aligns the shorter string against windows of the longer
+    one, so with c = characters of the shorter string that occur in the
+    longer one (counted with multiplicity) the score is at most
+    200c / (len(shorter) + c). Pairs where that bound is below the cutoff
+    are pruned with two small matrix products; the rest are scored with
+    rapidfuzz.process.cdist on `workers` threads (-1 = all cores).
+    """
+    from rapidfuzz import fuzz, process
+
+    keys = list(synonyms)
+    values = [str(v).lower() for v in synonyms.values()]
+    result = [set() for _ in names]
+    if not names or not keys:
+        return result
+
+    vocab = {ch: i for i, ch in enumerate(sorted(set("".join(values))))}
+    value_counts = _char_counts(values, vocab)
+    value_present = (value_counts > 0).astype(np.float32)
+    value_len = np.array([len(v) for v in values])
+
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start:start + chunk_size]
+        counts = _char_counts(chunk, vocab)
+        name_len = np.array([len(n) for n in chunk])
+        name_shorter = name_len[:, None] <= value_len[None, :]
+        shared = np.where(name_shorter, counts @ value_present.T, (counts > 0).astype(np.float32) @ value_counts.T)
+        shorter_len = np.where(name_shorter, name_len[:, None], value_len[None, :])
+        # 200c / (len + c) >= cutoff  <=>  c * (200 - cutoff) >= cutoff * len (整數運算，避免浮點誤差)
+        candidates = shared * (200 - score_cutoff) >= score_cutoff * shorter_len
+
+        rows = np.flatnonzero(candidates.any(axis=1))
+        cols = np.flatnonzero(candidates.any(axis=0))
+        if not rows.size:
+            continue
+        scores = process.cdist([chunk[i] for i in rows], [values[j] for j in cols], scorer=fuzz.partial_ratio,
+                               score_cutoff=score_cutoff, dtype=np.float64, workers=workers)
+        for r, c in zip(*np.nonzero(scores >= score_cutoff)):
+            result[start + rows[r]].add(keys[cols[c]])
+    return result
+
+
+TAG_MEMO_VERSION = 1  # 比對規則改變時遞增，使舊的 memo 失效
+
+
+def synonyms_hash(synonyms):
+    """Stable hash of a synonym map (and TAG_MEMO_VERSION); a memo is only valid for the hash it was built with."""
+    payload = json.dumps([TAG_MEMO_VERSION, sorted((str(k), str(v)) for k, v in synonyms.items())], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TagMemo:
+    """Thread-safe memo of normalized merchant name -> hidden_tags string.
+
+    Entries are only valid for one `synonyms_hash`; `new` holds the
+    entries added since the last save so callers can skip saving an
+    unchanged memo.
+    """
+
+    def __init__(self, synonyms_hash, entries=None):
+        self.synonyms_hash = synonyms_hash
+        self.entries = dict(entries or {})
+        self.new = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_many(self, names):
+        with self._lock:
+            return {name: self.entries[name] for name in names if name in self.entries}
+
+    def update(self, tags):
+        with self._lock:
+            self.entries.update(tags)
+            self.new.update(tags)
+
+    def merge(self, entries):
+        """Add entries loaded from elsewhere (not marked as new)."""
+        with self._lock:
+            for name, tags in entries.items():
+                self.entries.setdefault(name, tags)
+
+    def take_new(self):
+        """Return the entries added since the last call and start a new batch."""
+        with self._lock:
+            new, self.new = self.new, {}
+            return new
+
+    def to_frame(self):
+        with self._lock:
+            return self.frame_from_entries(self.entries, self.synonyms_hash)
+
+    @staticmethod
+    def frame_from_entries(entries, synonyms_hash):
+        return pd.DataFrame({"name": list(entries), "tags": list(entries.values()),
+                             "synonyms_hash": synonyms_hash})
+
+    @staticmethod
+    def entries_from_frame(df, synonyms_hash):
+        """Entries of a saved memo frame, or {} if it was built for another synonym map."""
+        if df.empty or "synonyms_hash" not in df.columns or (df["synonyms_hash"] != synonyms_hash).any():
+            return {}
+        return dict(zip(df["name"], df["tags"]))
@@ -0,0 +1,109 @@
+"""
+GCS 上 append-only 的隱藏標籤 memo
+每個 worker 只把本次新增的店名寫成小型且不可變的 delta 檔，不再對整份 memo 做讀取-修改-寫回；
+讀取端合併 base 與所有 delta，merge 階段再由 compact_tag_memo 將 delta 併回 base
+
+    tag_memo.parquet
+    tag_memo/delta-<毫秒時間戳>-<隨機碼>.parquet
+"""
+
+import io
+import time
+import uuid
+
+import pandas as pd
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from tag_matcher import TagMemo
+
+TAG_MEMO_BLOB_NAME = "tag_memo.parquet"
+TAG_MEMO_PREFIX = "tag_memo/"
+
+
+def _read_frame(blob):
+    return pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+
+
+def list_tag_memo_deltas(bucket):
+    """All delta objects, oldest first; metadata only."""
+    return sorted(bucket.list_blobs(prefix=TAG_MEMO_PREFIX), key=lambda b: b.name)
+
+
+def load_tag_memo_entries(bucket, synonyms_hash):
+    """Entries of the base and every delta built for `synonyms_hash`; objects for another SYNONYMS_MAP are ignored."""
+    entries = {}
+    blobs = [bucket.blob(TAG_MEMO_BLOB_NAME)] + list_tag_memo_deltas(bucket)
+    for blob in blobs:
+        try:
+            frame_entries = TagMemo.entries_from_frame(_read_frame(blob), synonyms_hash)
+        except NotFound:
+            continue
+        for name, tags in frame_entries.items():
+            entries.setdefault(name, tags)
+    return entries
+
+
+def append_tag_memo_delta(bucket, entries, synonyms_hash, max_retries=3):
+    """Write `entries` as one immutable delta object (unique name, if_generation_match=0); returns True if uploaded."""
+    if not entries:
+        return False
+    buf = io.BytesIO()
+    TagMemo.frame_from_entries(entries, synonyms_hash).to_parquet(buf, index=False)
+    name = f"{TAG_MEMO_PREFIX}delta-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+    for attempt in range(max_retries):
+        try:
+            bucket.blob(name).upload_from_string(buf.getvalue(), content_type="application/octet-stream",
+                                                 if_generation_match=0)
+            return True
+        except Exception as e:
+            print(f"[WARN] Tag memo delta upload failed (attempt {attempt + 1}/{max_retries}): {e}")
+            time.sleep(0.5 * (attempt + 1))
+    return False
+
+
+def compact_tag_memo(bucket):
+    """Fold the deltas into tag_memo.parquet and delete them.
+
+    The newest delta's synonyms_hash wins; entries built for an older
+    SYNONYMS_MAP are dropped. The base is replaced with if_generation_match,
+    so a concurrent compaction makes this one a no-op, and only the deltas
+    that were read are deleted. Returns a summary dict.
+    """
+    deltas = list_tag_memo_deltas(bucket)
+    summary = {"deltas_folded": 0, "entries": 0}
+    if not deltas:
+        return summary
+    base_blob = bucket.blob(TAG_MEMO_BLOB_NAME)
+    try:
+        base_blob.reload()
+        objects = [(base_blob, _read_frame(base_blob))]
+    except NotFound:
+        base_blob = None
+        objects = []
+    objects += [(blob, _read_frame(blob)) for blob in deltas]
+
+    # 以最新一份非空 delta 的雜湊為準
+    current = next((df["synonyms_hash"].iloc[0] for _, df in reversed(objects)
+                    if not df.empty and "synonyms_hash" in df.columns), None)
+    entries = {}
+    for _, df in objects:
+        for name, tags in TagMemo.entries_from_frame(df, current).items():
+            entries.setdefault(name, tags)
+
+    buf = io.BytesIO()
+    TagMemo.frame_from_entries(entries, current).to_parquet(buf, index=False)
+    try:
+        bucket.blob(TAG_MEMO_BLOB_NAME).upload_from_string(
+            buf.getvalue(), content_type="application/octet-stream",
+            if_generation_match=base_blob.generation if base_blob else 0)
+    except PreconditionFailed:
+        print("[WARN] Tag memo changed during compaction, skipping")
+        return summary
+    for delta in deltas:
+        try:
+            delta.delete(if_generation_match=delta.generation)
+        except NotFound:
+            pass
+    summary.update(deltas_folded=len(deltas), entries=len(entries))
+    print(f"[INFO] Tag memo compacted: {summary}")
+    return summary